@@ -2,19 +2,21 @@ from os import environ
 from time import time
 from re import split
 from uuid import uuid4
-from orjson import dumps, OPT_SORT_KEYS
-from aiohttp import ClientSession
-from asyncio import CancelledError
+from asyncio import gather, CancelledError
 from traceback import format_exc
 
-from discord import Embed, ButtonStyle, Interaction, TextChannel, Role
+from discord import Embed, ButtonStyle, Interaction, TextChannel, Role, SelectOption
 from discord.commands import slash_command, SlashCommandGroup, Option
-from discord.ui import View, button, Button
+from discord.ui import View, button, Button, Select
 from discord.errors import NotFound
 
-from google.cloud.firestore import Increment
-
 from helpers import constants
+from helpers.statistics import statistics
+from helpers.logos import logos
+from helpers.alerts import alertIndex, ticker_hash
+from helpers.quotas import quotas
+from helpers.triggers import triggers
+from helpers.tickers import tickerRegistry
 from assets import static_storage
 from Processor import process_quote_arguments, process_task
 
@@ -65,22 +67,17 @@ class AlertCommand(BaseCommand):
 					except NotFound: pass
 					return
 
-				totalAlertCount = 0
-				if request.is_registered():
-					count1 = await self.database.collection(f"details/marketAlerts/{request.accountId}").count().get()
-					totalAlertCount += count1[0][0].value
-				count2 = await self.database.collection(f"details/marketAlerts/{request.authorId}").count().get()
-				totalAlertCount += count2[0][0].value
+				ownerIds = [request.accountId, request.authorId] if request.is_registered() else [request.authorId]
 
 				if request.is_registered():
-					if totalAlertCount + len(levels) > 250:
+					if await quotas.exceeds("marketAlerts", ownerIds, 250, len(levels)):
 						embed = Embed(title="You can only create up to 250 price alerts. Remove some before creating new ones by calling </alert list:928980578739568651>", color=constants.colors["gray"])
 						embed.set_author(name="Maximum number of price alerts reached", icon_url=static_storage.error_icon)
 						try: await ctx.respond(embed=embed, view=RedirectView(f"https://www.alpha.bot/account/alerts"), ephemeral=True)
 						except NotFound: pass
 						return
 				else:
-					if totalAlertCount + len(levels) > 10:
+					if await quotas.exceeds("marketAlerts", ownerIds, 10, len(levels)):
 						embed = Embed(title="Create more than 10 price alerts by authorizing Alpha.bot, or remove some before creating new ones by calling </alert list:928980578739568651>", description="You can increase your limit to 250 by signing up for a free account on [our website](https://www.alpha.bot/sign-up) or via the button below.", color=constants.colors["gray"])
 						embed.set_author(name="Maximum number of price alerts reached", icon_url=static_storage.error_icon)
 						try: await ctx.respond(embed=embed, view=AuthView(redirect="account/alerts"), ephemeral=True)
@@ -120,37 +117,46 @@ class AlertCommand(BaseCommand):
 					currentPlatform = payload.get("platform")
 					currentTask = task.get(currentPlatform)
 					ticker = currentTask.get("ticker")
-					tickerDump = dumps(ticker, option=OPT_SORT_KEYS)
+					tickerId = ticker_hash(ticker)
 					exchange = ticker.get("exchange")
 					exchangeName = f" ({exchange.get('name')})" if exchange else ""
 					pairQuoteName = " " + ticker.get("quote") if ticker.get("quote") else ""
 
-					response1, response2 = [], []
-					if request.is_registered():
-						response1 = await self.database.collection(f"details/marketAlerts/{request.accountId}").get()
-					response2 = await self.database.collection(f"details/marketAlerts/{request.authorId}").get()
-					priceAlerts = [e.to_dict() for e in response1] + [e.to_dict() for e in response2]
+					owners = [await alertIndex.get(ownerId) for ownerId in ownerIds]
+					reloaded = False
+
+					if currentPlatform == "CCXT":
+						thumbnailUrl = ticker.get("image")
+					else:
+						thumbnailUrl = await logos.get(ticker)
+
+					if currentPlatform != "CCXT":
+						currentTask["ticker"]["image"] = thumbnailUrl
+					compactTask = await tickerRegistry.compact(currentTask)
 
 					newAlerts = []
 					for level in levels:
 						levelText = "{:,.10f}".format(level).rstrip('0').rstrip('.')
 
-						for alert in priceAlerts:
-							alertTicker = alert["request"].get("ticker")
-
-							if dumps(alertTicker, option=OPT_SORT_KEYS) == tickerDump:
-								if alert["level"] == level:
-									embed = Embed(title=f"Price alert for {ticker.get('name')}{exchangeName} at {levelText}{pairQuoteName} already exists.", color=constants.colors["gray"])
-									embed.set_author(name="Alert already exists", icon_url=static_storage.error_icon)
-									try: await ctx.interaction.edit_original_response(embed=embed)
-									except NotFound: pass
-									return
-								elif alert["level"] * 0.999 < level < alert["level"] * 1.001:
-									embed = Embed(title=f"Price alert at {alert['levelText']}{pairQuoteName}, which is within 0.1% of {levelText}{pairQuoteName}, already exists.", color=constants.colors["gray"])
-									embed.set_author(name="Alert already exists", icon_url=static_storage.error_icon)
-									try: await ctx.interaction.edit_original_response(embed=embed)
-									except NotFound: pass
-									return
+						match, existingLevelText = alertIndex.find(owners, tickerId, level)
+						if match is not None and not reloaded:
+							# Alerts fired by the alert service or removed on the website only leave the index once it's read again
+							owners = [await alertIndex.reload(ownerId) for ownerId in ownerIds]
+							reloaded = True
+							match, existingLevelText = alertIndex.find(owners, tickerId, level)
+
+						if match == "exact":
+							embed = Embed(title=f"Price alert for {ticker.get('name')}{exchangeName} at {levelText}{pairQuoteName} already exists.", color=constants.colors["gray"])
+							embed.set_author(name="Alert already exists", icon_url=static_storage.error_icon)
+							try: await ctx.interaction.edit_original_response(embed=embed)
+							except NotFound: pass
+							return
+						elif match == "near":
+							embed = Embed(title=f"Price alert at {existingLevelText}{pairQuoteName}, which is within 0.1% of {levelText}{pairQuoteName}, already exists.", color=constants.colors["gray"])
+							embed.set_author(name="Alert already exists", icon_url=static_storage.error_icon)
+							try: await ctx.interaction.edit_original_response(embed=embed)
+							except NotFound: pass
+							return
 
 						currentLevel = payload["candles"][-1][4]
 						currentLevelText = "{:,.10f}".format(currentLevel).rstrip('0').rstrip('.')
@@ -162,30 +168,18 @@ class AlertCommand(BaseCommand):
 							except NotFound: pass
 							return
 
-						if currentPlatform == "CCXT":
-							thumbnailUrl = ticker.get("image")
-						else:
-							async with ClientSession() as session:
-								if ticker['exchange'].get("id") is not None and ticker['exchange']['id'] != "forex":
-									url = f"https://api.twelvedata.com/logo?apikey={environ['TWELVEDATA_KEY']}&interval=1min&type={ticker['metadata']['type'].replace(' ', '%20')}&format=JSON&symbol={ticker.get('symbol')}&exchange={ticker['exchange']['name']}"
-								else:
-									url = f"https://api.twelvedata.com/logo?apikey={environ['TWELVEDATA_KEY']}&interval=1min&type={ticker['metadata']['type'].replace(' ', '%20')}&format=JSON&symbol={ticker.get('symbol')}"
-								async with session.get(url) as resp:
-									response = await resp.json()
-									thumbnailUrl = response.get("url")
-									currentTask["ticker"]["image"] = thumbnailUrl
-
 						newAlerts.append({
 							"timestamp": time(),
 							"guild": None if channel is None else str(request.guildId),
 							"channel": None if channel is None else str(channel.id),
 							"backupChannel": str(request.channelId),
+							"authorId": str(request.authorId),
 							"service": "Discord",
-							"request": currentTask,
+							"request": compactTask,
 							"currentPlatform": currentPlatform,
 							"level": level,
 							"levelText": levelText,
-							"version": 5,
+							"version": 6 if tickerRegistry.compactOnly else 5,
 							"triggerMessage": message,
 							"triggerTag": None if role is None else str(role.id),
 							"placement": "above" if level > currentLevel else "below",
@@ -220,14 +214,14 @@ class AlertCommand(BaseCommand):
 					try: await ctx.interaction.edit_original_response(embed=embed)
 					except NotFound: pass
 
-					for newAlert in newAlerts:
-						alertId = str(uuid4())
-						if request.is_registered():
-							await self.database.document(f"details/marketAlerts/{request.accountId}/{alertId}").set(newAlert)
-						else:
-							await self.database.document(f"details/marketAlerts/{request.authorId}/{alertId}").set(newAlert)
+					ownerId = request.accountId if request.is_registered() else request.authorId
+					newAlerts = {str(uuid4()): newAlert for newAlert in newAlerts}
+					await quotas.add_many("marketAlerts", ownerId, newAlerts)
+					for alertId, newAlert in newAlerts.items():
+						alertIndex.add(ownerId, alertId, newAlert)
+						triggers.add(ownerId, alertId, newAlert)
 
-					await self.database.document("discord/statistics").set({request.snapshot: {"alert": Increment(len(levels))}}, merge=True)
+					statistics.increment(request.snapshot, "alert", len(levels))
 					await self.cleanup(ctx, request)
 
 			else:
@@ -251,12 +245,8 @@ class AlertCommand(BaseCommand):
 			request = await self.create_request(ctx)
 			if request is None: return
 
-			totalAlertCount = 0
-			if request.is_registered():
-				count1 = await self.database.collection(f"details/marketAlerts/{request.accountId}").count().get()
-				totalAlertCount += count1[0][0].value
-			count2 = await self.database.collection(f"details/marketAlerts/{request.authorId}").count().get()
-			totalAlertCount += count2[0][0].value
+			ownerIds = [request.accountId, request.authorId] if request.is_registered() else [request.authorId]
+			totalAlertCount = await quotas.total("marketAlerts", ownerIds)
 
 			if totalAlertCount == 0:
 				embed = Embed(title="You haven't set any price alerts yet.", color=constants.colors["gray"])
@@ -270,23 +260,21 @@ class AlertCommand(BaseCommand):
 				except NotFound: pass
 
 			else:
-				response1, response2 = [], []
-				if request.is_registered():
-					response1 = await self.database.collection(f"details/marketAlerts/{request.accountId}").get()
-				response2 = await self.database.collection(f"details/marketAlerts/{request.authorId}").get()
-				priceAlerts = [(e.id, e.to_dict(), request.accountId) for e in response1] + [(e.id, e.to_dict(), request.authorId) for e in response2]
-
-				embed = Embed(title=f"You've created {totalAlertCount} price alert{'' if totalAlertCount == 1 else 's'}.", color=constants.colors["light blue"])
-				try: await ctx.respond(embed=embed)
-				except NotFound: pass
-
-				for key, alert, matchedId in priceAlerts:
-					ticker = alert["request"].get("ticker")
+				# Only the fields shown in the list are fetched, not the full request task stored with every alert
+				response = await self.database.collection(f"details/marketAlerts/{request.authorId}").select(["request.ticker.name", "request.ticker.exchange.name", "request.ticker.quote", "request.tickerRef", "level", "levelText"]).get()
+				tasks = await gather(*[tickerRegistry.expand(alert.to_dict()["request"]) for alert in response])
+
+				priceAlerts = []
+				for alert, task in zip(response, tasks):
+					properties = alert.to_dict()
+					ticker = task.get("ticker")
 					exchangeName = f" ({ticker.get('exchange').get('name')})" if ticker.get("exchange") else ""
 					pairQuoteName = " " + ticker.get("quote") if ticker.get("quote") else ""
+					priceAlerts.append((str(request.authorId), alert.id, f"{ticker.get('name')}{exchangeName} at {properties.get('levelText', properties['level'])}{pairQuoteName}"))
 
-					embed = Embed(title=f"{ticker.get('name')}{exchangeName} price alert at {alert.get('levelText', alert['level'])}{pairQuoteName}.", color=constants.colors["deep purple"])
-					await ctx.followup.send(embed=embed, view=DeleteView(database=self.database, pathId=f"details/marketAlerts/{matchedId}/{key}", userId=request.authorId), ephemeral=True)
+				view = AlertBrowserView(priceAlerts, userId=request.authorId)
+				try: await ctx.respond(embed=view.embed(), view=view, ephemeral=True)
+				except NotFound: pass
 
 		except CancelledError: pass
 		except:
@@ -294,16 +282,85 @@ class AlertCommand(BaseCommand):
 			if environ["PRODUCTION"]: self.logging.report_exception(user=f"{ctx.author.id} {ctx.guild.id if ctx.guild is not None else -1}: /alert list")
 
 
-class DeleteView(View):
-	def __init__(self, database, pathId, userId=None):
-		super().__init__(timeout=None)
-		self.database = database
-		self.pathId = pathId
+class AlertBrowserView(View):
+	def __init__(self, alerts, userId, pageSize=10):
+		super().__init__(timeout=600)
+		self.alerts = alerts
 		self.userId = userId
+		self.pageSize = pageSize
+		self.page = 0
+		self.dropdown = None
+		self.render()
+
+	def pages(self):
+		return max((len(self.alerts) - 1) // self.pageSize + 1, 1)
+
+	def current(self):
+		return self.alerts[self.page * self.pageSize:(self.page + 1) * self.pageSize]
+
+	def embed(self):
+		if len(self.alerts) == 0:
+			embed = Embed(title="You don't have any price alerts left.", color=constants.colors["gray"])
+			embed.set_author(name="Price Alerts", icon_url=static_storage.error_icon)
+			return embed
+		description = "\n".join([f"**{self.page * self.pageSize + i + 1}.** {title}" for i, (_, _, title) in enumerate(self.current())])
+		embed = Embed(title=f"You've created {len(self.alerts)} price alert{'' if len(self.alerts) == 1 else 's'}.", description=description, color=constants.colors["light blue"])
+		embed.set_footer(text=f"Page {self.page + 1} of {self.pages()}")
+		return embed
+
+	def render(self):
+		self.page = min(self.page, self.pages() - 1)
+		if self.dropdown is not None:
+			self.remove_item(self.dropdown)
+			self.dropdown = None
+		if len(self.alerts) != 0:
+			self.dropdown = AlertsDropdown(self.current(), self.delete)
+			self.add_item(self.dropdown)
+		self.previous.disabled = self.page == 0
+		self.next.disabled = self.page >= self.pages() - 1
+
+	async def delete(self, interaction, selected):
+		if self.userId != interaction.user.id: return
+		owners = {}
+		for ownerId, alertId, _ in self.alerts:
+			if f"{ownerId}/{alertId}" in selected:
+				owners.setdefault(ownerId, []).append(alertId)
+		for ownerId, alertIds in owners.items():
+			await quotas.remove_many("marketAlerts", ownerId, alertIds)
+			for alertId in alertIds:
+				alertIndex.remove(ownerId, alertId)
+				triggers.remove(ownerId, alertId)
+		self.alerts = [e for e in self.alerts if f"{e[0]}/{e[1]}" not in selected]
+		self.render()
+		await interaction.response.edit_message(embed=self.embed(), view=self)
+
+	@button(label="Previous", style=ButtonStyle.secondary, row=1)
+	async def previous(self, button: Button, interaction: Interaction):
+		if self.userId != interaction.user.id: return
+		self.page -= 1
+		self.render()
+		await interaction.response.edit_message(embed=self.embed(), view=self)
 
-	@button(label="Delete", style=ButtonStyle.danger)
-	async def delete(self, button: Button, interaction: Interaction):
+	@button(label="Next", style=ButtonStyle.secondary, row=1)
+	async def next(self, button: Button, interaction: Interaction):
 		if self.userId != interaction.user.id: return
-		await self.database.document(self.pathId).delete()
-		embed = Embed(title="Alert deleted", color=constants.colors["gray"])
-		await interaction.response.edit_message(embed=embed, view=None)
\ No newline at end of file
+		self.page += 1
+		self.render()
+		await interaction.response.edit_message(embed=self.embed(), view=self)
+
+
+class AlertsDropdown(Select):
+	def __init__(self, alerts, callback):
+		self._callback = callback
+		options = [SelectOption(label=title[:100], value=f"{ownerId}/{alertId}") for ownerId, alertId, title in alerts]
+
+		super().__init__(
+			placeholder="Choose price alerts to delete",
+			min_values=1,
+			max_values=len(options),
+			options=options,
+			row=0
+		)
+
+	async def callback(self, interaction: Interaction):
+		await self._callback(interaction, set(self.values))
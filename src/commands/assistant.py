@@ -7,7 +7,6 @@ from traceback import format_exc
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
 
-from google.cloud.firestore import Increment
 
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
@@ -15,6 +14,7 @@ from google.auth.transport.grpc import secure_authorized_channel
 from google.assistant.embedded.v1alpha2 import embedded_assistant_pb2, embedded_assistant_pb2_grpc
 
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from assets import jokes
 
@@ -52,7 +52,7 @@ class AskCommand(BaseCommand):
 				try: await ctx.respond(content="Sorry, I can't help you with that.", ephemeral=ephemeral)
 				except NotFound: pass
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"alpha": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "alpha")
 
 		except CancelledError: pass
 		except:
@@ -1,8 +1,6 @@
 from os import environ
 from time import time
-from asyncio import sleep
 from re import sub
-from orjson import dumps
 from traceback import format_exc
 
 from discord import Embed, ButtonStyle, Interaction, PartialEmoji
@@ -10,14 +8,14 @@ from discord.ext.commands import Cog
 from discord.ui import View, button, Button
 from google.cloud.firestore import AsyncClient as FirestoreAsyncClient
 from google.cloud.firestore_v1.base_query import FieldFilter
-from google.cloud import pubsub_v1
 
 from helpers import constants
+from helpers.telemetry import publisher
+from helpers.scheduler import scheduler
 from assets import static_storage
 from Processor import autocomplete_ticker, autocomplete_venues
 
 database = FirestoreAsyncClient()
-publisher = pubsub_v1.PublisherClient()
 REQUESTS_TOPIC_NAME = "projects/nlc-bot-36685/topics/discord-requests"
 TELEMETRY_TOPIC_NAME = "projects/nlc-bot-36685/topics/discord-telemetry"
 
@@ -79,7 +77,7 @@ class BaseCommand(Cog):
 				currentTask = task.get(task.get("currentPlatform"))
 				base = currentTask.get("ticker").get("base")
 				if base is None: base = currentTask.get("ticker").get("id")
-				publisher.publish(REQUESTS_TOPIC_NAME, dumps({
+				publisher.submit(REQUESTS_TOPIC_NAME, {
 					"timestamp": timestamp,
 					"command": command,
 					"user": str(request.authorId),
@@ -88,9 +86,9 @@ class BaseCommand(Cog):
 					"base": base,
 					"platform": task.get("currentPlatform"),
 					"count": task.get("requestCount", 1)
-				}))
+				})
 			if telemetry is not None:
-				publisher.publish(TELEMETRY_TOPIC_NAME, dumps({
+				publisher.submit(TELEMETRY_TOPIC_NAME, {
 					"timestamp": timestamp,
 					"command": command,
 					"database": telemetry["database"],
@@ -99,17 +97,13 @@ class BaseCommand(Cog):
 					"request": telemetry["request"],
 					"response": telemetry["response"],
 					"count": task.get("requestCount", 1)
-				}))
+				})
 
 	async def cleanup(self, ctx, request, removeView=False):
 		if request.autodelete is not None:
-			await sleep(request.autodelete * 60)
-			try: await ctx.interaction.edit_original_response(embeds=[], attachments=[], view=None, content=f"The response has been removed. You can make a new request using {ctx.command.mention}")
-			except: pass
+			scheduler.schedule(request.autodelete * 60, ctx.interaction.application_id, ctx.interaction.token, content=f"The response has been removed. You can make a new request using {ctx.command.mention}")
 		elif removeView:
-			await sleep(600)
-			try: await ctx.interaction.edit_original_response(view=None)
-			except: pass
+			scheduler.schedule(600, ctx.interaction.application_id, ctx.interaction.token)
 
 	async def unknown_error(self, ctx):
 		embed = Embed(title="Looks like something went wrong. The issue has been reported.", color=constants.colors["gray"])
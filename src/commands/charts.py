@@ -8,9 +8,9 @@ from discord import Embed, File, ButtonStyle, SelectOption, Interaction, Partial
 from discord.commands import slash_command, SlashCommandGroup, Option
 from discord.ui import View, button, Button, Select
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from Processor import process_chart_arguments, process_task, get_direct_ichibot_socket
 from DatabaseConnector import DatabaseConnector
@@ -64,7 +64,7 @@ class ChartCommand(BaseCommand):
 		except NotFound: pass
 		request.set_delay("response", time() - requestCheckpoint)
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"c": Increment(len(tasks))}}, merge=True)
+		statistics.increment(request.snapshot, "c", len(tasks))
 		await self.log_request("charts", request, tasks, telemetry=request.telemetry)
 		await self.cleanup(ctx, request, removeView=True)
 
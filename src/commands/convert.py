@@ -5,11 +5,11 @@ from traceback import format_exc
 from discord import Embed
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 
 from helpers import constants
+from helpers.statistics import statistics
+from helpers.conversions import conversions
 from assets import static_storage
-from Processor import process_conversion
 
 from commands.base import BaseCommand
 
@@ -29,7 +29,7 @@ class ConvertCommand(BaseCommand):
 
 			platforms = request.get_platform_order_for("convert")
 			[(payload, responseMessage), _] = await gather(
-				process_conversion(request, fromTicker.upper(), toTicker.upper(), amount, platforms),
+				conversions.convert(request, fromTicker.upper(), toTicker.upper(), amount, platforms),
 				ctx.defer()
 			)
 
@@ -40,12 +40,14 @@ class ConvertCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 			else:
-				embed = Embed(title=f"{payload['quotePrice']} ≈ {payload['quoteConvertedPrice']}", description=f"{payload['quoteVolume']} {payload['quoteConvertedVolume']}", color=constants.colors[payload["messageColor"]])
+				embed = Embed(title=f"{payload['quotePrice']} ≈ {payload['quoteConvertedPrice']}", color=constants.colors[payload["messageColor"]])
+				if "quoteVolume" in payload: embed.description = f"{payload['quoteVolume']} {payload['quoteConvertedVolume']}"
+				if "path" in payload: embed.set_footer(text=f"Converted via {' → '.join(payload['path'])}")
 				embed.set_author(name="Conversion", icon_url=self.bot.user.avatar.url)
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"convert": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "convert")
 
 		except CancelledError: pass
 		except:
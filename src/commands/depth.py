@@ -9,9 +9,8 @@ from discord.embeds import EmptyEmbed
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
 
-from google.cloud.firestore import Increment
-
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from Processor import process_quote_arguments, process_task
 
@@ -38,7 +37,7 @@ class DepthCommand(BaseCommand):
 			try: await ctx.interaction.edit_original_response(file=File(payload.get("data"), filename="{:.0f}-{}-{}.png".format(time() * 1000, request.authorId, randint(1000, 9999))))
 			except NotFound: pass
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"d": Increment(1)}}, merge=True)
+		statistics.increment(request.snapshot, "d")
 		await self.log_request("depth", request, [task])
 
 	@slash_command(name="depth", description="Pull orderbook visualization snapshots of stocks and cryptocurrencies.")
@@ -7,9 +7,8 @@ from discord.embeds import EmptyEmbed
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
 
-from google.cloud.firestore import Increment
-
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from helpers.utils import add_decimal_zeros
 from Processor import process_quote_arguments, process_task
@@ -109,7 +108,7 @@ class DetailsCommand(BaseCommand):
 			try: await ctx.respond(embed=embed)
 			except NotFound: pass
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"info": Increment(1)}}, merge=True)
+		statistics.increment(request.snapshot, "info")
 		await self.log_request("details", request, [task])
 
 	@slash_command(name="info", description="Pull up asset information of stocks and cryptocurrencies.")
@@ -8,9 +8,9 @@ from discord import Embed, File, ButtonStyle, SelectOption, Interaction, Partial
 from discord.commands import slash_command, SlashCommandGroup, Option
 from discord.ui import View, button, Button, Select
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from Processor import process_chart_arguments, process_task
 
@@ -45,7 +45,7 @@ class FlowCommand(BaseCommand):
 					try: await ctx.interaction.edit_original_response(file=discord.File(payload.get("data"), filename="{:.0f}-{}-{}.png".format(time() * 1000, request.authorId, randint(1000, 9999))), view=actions)
 					except NotFound: pass
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"flow": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "flow")
 			await self.cleanup(ctx, request, removeView=True)
 
 		else:
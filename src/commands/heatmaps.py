@@ -7,9 +7,9 @@ from traceback import format_exc
 from discord import Embed, File
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from Processor import process_heatmap_arguments, process_task, autocomplete_hmap_timeframe, autocomplete_market, autocomplete_category, autocomplete_size, autocomplete_group
 
@@ -52,7 +52,7 @@ class HeatmapCommand(BaseCommand):
 		try: await ctx.interaction.edit_original_response(embeds=embeds, files=files, view=actions)
 		except NotFound: pass
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"hmap": Increment(len(tasks))}}, merge=True)
+		statistics.increment(request.snapshot, "hmap", len(tasks))
 		await self.cleanup(ctx, request)
 
 	@slash_command(name="hmap", description="Pull market heatmaps from TradingView.")
@@ -8,10 +8,10 @@ from discord import Embed, File, ButtonStyle, SelectOption, Interaction, Partial
 from discord.commands import slash_command, Option
 from discord.ui import View, button, Button, Select
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 from google.cloud.firestore_v1.base_query import FieldFilter
 
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from Processor import autocomplete_layout_timeframe, process_chart_arguments, process_task
 
@@ -108,7 +108,7 @@ class LayoutCommand(BaseCommand):
 			except NotFound: pass
 			request.set_delay("response", time() - requestCheckpoint)
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"c": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "c")
 			await self.log_request("layouts", request, [task], telemetry=request.telemetry)
 			await self.cleanup(ctx, request, removeView=True)
 
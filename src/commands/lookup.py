@@ -8,10 +8,10 @@ from discord import Embed, ButtonStyle, Interaction, File
 from discord.commands import SlashCommandGroup, Option
 from discord.ui import View, button, Button
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
-from pycoingecko import CoinGeckoAPI
 
 from helpers import constants
+from helpers.statistics import statistics
+from helpers.http import get_coins_markets
 from assets import static_storage
 from Processor import process_chart_arguments, process_quote_arguments, process_task, get_listings
 
@@ -59,7 +59,7 @@ class LookupCommand(BaseCommand):
 				try: await ctx.respond(embed=embed)
 				except NotFound: pass
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"mk": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "mk")
 
 		except CancelledError: pass
 		except:
@@ -82,16 +82,10 @@ class LookupCommand(BaseCommand):
 
 			category = " ".join(category.lower().split())
 			if category == "crypto gainers":
-				rawData = []
-				cg = CoinGeckoAPI(api_key=environ["COINGECKO_API_KEY"])
-				page = 1
-				while True:
-					rawData += cg.get_coins_markets(vs_currency="usd", order="market_cap_desc", per_page=250, page=page, price_change_percentage="24h")
-					page += 1
-					if page > 4: break
+				rawData = await get_coins_markets(max(10, min(limit, 1000)))
 
 				response = []
-				for e in rawData[:max(10, limit)]:
+				for e in rawData:
 					if e.get("price_change_percentage_24h_in_currency", None) is not None:
 						response.append({"symbol": e["symbol"].upper(), "change": e["price_change_percentage_24h_in_currency"]})
 				response = sorted(response, key=lambda k: k["change"], reverse=True)[:10]
@@ -103,16 +97,10 @@ class LookupCommand(BaseCommand):
 				except NotFound: pass
 
 			elif category == "crypto losers":
-				rawData = []
-				cg = CoinGeckoAPI(api_key=environ["COINGECKO_API_KEY"])
-				page = 1
-				while True:
-					rawData += cg.get_coins_markets(vs_currency="usd", order="market_cap_desc", per_page=250, page=page, price_change_percentage="24h")
-					page += 1
-					if page > 4: break
+				rawData = await get_coins_markets(max(10, min(limit, 1000)))
 
 				response = []
-				for e in rawData[:max(10, limit)]:
+				for e in rawData:
 					if e.get("price_change_percentage_24h_in_currency", None) is not None:
 						response.append({"symbol": e["symbol"].upper(), "change": e["price_change_percentage_24h_in_currency"]})
 				response = sorted(response, key=lambda k: k["change"])[:10]
@@ -128,7 +116,7 @@ class LookupCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"t": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "t")
 
 		except CancelledError: pass
 		except:
@@ -189,7 +177,7 @@ class LookupCommand(BaseCommand):
 			try: await ctx.interaction.edit_original_response(embeds=embeds, files=files, view=actions)
 			except NotFound: pass
 
-			await self.database.document("discord/statistics").set({request.snapshot: {"c": Increment(1)}}, merge=True)
+			statistics.increment(request.snapshot, "c")
 			await self.log_request("charts", request, [task])
 			await self.cleanup(ctx, request, removeView=True)
 
@@ -1,20 +1,26 @@
 from os import environ
 from time import time
 from uuid import uuid4
-from aiohttp import ClientSession
-from asyncio import gather, CancelledError, wait, create_task
+from asyncio import gather, CancelledError
 from traceback import format_exc
 
 from discord import Embed, ButtonStyle, Interaction
 from discord.commands import SlashCommandGroup, Option
 from discord.ui import View, button, Button
 from discord.errors import NotFound
-from google.cloud.firestore import Increment, DELETE_FIELD
+from google.cloud.firestore import DELETE_FIELD, Query
 
 from helpers import constants
+from helpers.cache import accountProperties
+from helpers.statistics import statistics
+from helpers.logos import logos
+from helpers.quotas import quotas
+from helpers.tickers import tickerRegistry
+from helpers.valuation import valuations
+from helpers.jobs import bulkDeleter
 from assets import static_storage
 from helpers.utils import timestamp_to_date
-from Processor import process_quote_arguments, process_task, match_ticker, process_conversion, get_formatted_price_ccxt, get_formatted_amount_ccxt
+from Processor import process_quote_arguments, process_task, match_ticker, get_formatted_price_ccxt, get_formatted_amount_ccxt
 from DatabaseConnector import DatabaseConnector
 
 from commands.base import BaseCommand, Confirm, AuthView
@@ -39,7 +45,9 @@ class PaperCommand(BaseCommand):
 		ticker = currentTask.get("ticker")
 		exchange = ticker.get("exchange")
 
-		outputTitle, responseMessage, paper, pendingOrder = await self.process_trade(request.accountProperties.get("paperTrader", {}), amount, level, orderType, currentPlatform, currentTask, payload)
+		# Trades write the whole paper balance back, so it's always read fresh instead of from the account cache
+		paper = await self.paper_properties(request)
+		outputTitle, responseMessage, paper, pendingOrder = await self.process_trade(paper, amount, level, orderType, currentPlatform, currentTask, payload)
 
 		if pendingOrder is None:
 			embed = Embed(title=responseMessage, color=constants.colors["gray"])
@@ -69,8 +77,7 @@ class PaperCommand(BaseCommand):
 
 			if pendingOrder.parameters["isLimit"]:
 				if request.is_registered():
-					openOrdersCount = await self.database.collection(f"details/openPaperOrders/{request.accountId}").count().get()
-					if openOrdersCount[0][0].value >= 50:
+					if await quotas.exceeds("openPaperOrders", [request.accountId], 50):
 						embed = Embed(title="You can only create up to 50 pending paper trades.", color=constants.colors["gray"])
 						embed.set_author(name="Maximum number of open paper orders reached", icon_url=static_storage.error_icon)
 						try: await ctx.interaction.edit_original_response(embed=embed)
@@ -82,20 +89,33 @@ class PaperCommand(BaseCommand):
 					try: await ctx.respond(embed=embed, view=AuthView())
 					except NotFound: pass
 
+			# The balance could have changed while the order was waiting for confirmation
+			paper = await self.paper_properties(request)
+			if not self.covers(paper, orderType, currentPlatform, currentTask, pendingOrder):
+				embed = Embed(title="Your paper balance changed and no longer covers this order.", color=constants.colors["gray"])
+				embed.set_author(name="Insufficient paper balance", icon_url=static_storage.error_icon)
+				try: await ctx.interaction.edit_original_response(embed=embed)
+				except NotFound: pass
+				return
+
 			for platform in task.get("platforms"): task[platform]["ticker"].pop("tree")
 			paper = self.post_trade(paper, orderType, currentPlatform, currentTask, payload, pendingOrder)
 
-			pendingOrder.parameters["request"] = task
+			pendingOrder.parameters["request"] = await tickerRegistry.compact_request(task)
 			if paper.get("globalLastReset", 0) == 0: paper["globalLastReset"] = int(time())
 
 			if request.is_registered():
 				await self.database.document(f"accounts/{request.accountId}").set({"paperTrader": paper}, merge=True)
-				folder = "openPaperOrders" if pendingOrder.parameters["isLimit"] else "paperOrderHistory"
-				await self.database.document(f"details/{folder}/{request.accountId}/{str(uuid4())}").set(pendingOrder.parameters)
+				if pendingOrder.parameters["isLimit"]:
+					await quotas.add("openPaperOrders", request.accountId, str(uuid4()), pendingOrder.parameters)
+				else:
+					await self.database.document(f"details/paperOrderHistory/{request.accountId}/{str(uuid4())}").set(pendingOrder.parameters)
 			else:
 				await self.database.document(f"discord/properties/users/{request.authorId}").set({"paperTrader": paper}, merge=True)
 				folder = "openPaperOrders" if pendingOrder.parameters["isLimit"] else "paperOrderHistory"
 				await self.database.document(f"details/{folder}/{request.authorId}/{str(uuid4())}").set(pendingOrder.parameters)
+			accountProperties.invalidate(request.accountId, request.authorId)
+			valuations.invalidate(request.accountId, request.authorId)
 
 			successMessage = f"Paper {orderType} order of {pendingOrder.amountText} {ticker.get('base')} at {pendingOrder.priceText} was successfully {'placed' if pendingOrder.parameters['isLimit'] else 'executed'}."
 			embed = Embed(title=successMessage, color=constants.colors["deep purple"])
@@ -103,7 +123,7 @@ class PaperCommand(BaseCommand):
 			try: await ctx.interaction.edit_original_response(embed=embed)
 			except NotFound: pass
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"paper": Increment(1)}}, merge=True)
+		statistics.increment(request.snapshot, "paper")
 
 	async def paper_order_proxy(
 		self,
@@ -194,28 +214,17 @@ class PaperCommand(BaseCommand):
 			embed = Embed(title="Paper balance:", color=constants.colors["deep purple"])
 			embed.set_author(name="Paper Trader", icon_url=self.bot.user.avatar.url)
 
-			totalValue = 0
-			tasks, assets, holdings = [], [], []
-
-			for platform, balances in paperBalances.items():
-				if platform == "USD": continue
-				for asset, holding in balances.items():
-					if holding == 0: continue
-					tasks.append(process_conversion(request, asset, "USD", holding, [platform], acceptable=["USD", "USDT", "USDC", "BUSD"]))
-					assets.append((platform, asset))
-					holdings.append(holding)
+			valuation = await valuations.get(request, paper)
+			assets = list(valuation.assets)
 
-			responses = await gather(*tasks)
-
-			for (payload, responseMessage), (_, asset), holding in zip(responses, assets, holdings):
+			totalValue = 0
+			for _, asset, holding, convertedValue in valuation.holdings:
 				balanceText = "{:,.4f} {}".format(holding, asset)
 
-				if payload is None:
-					print(f"Conversion failed: {responseMessage}")
+				if convertedValue is None:
 					valueText = "Unavailable"
 				else:
-					convertedValue = payload["raw"]["quotePrice"][0] if payload is not None else 0
-					valueText = "≈ {:,.4f} {}".format(convertedValue, "USD") if payload is not None else "Unavailable"
+					valueText = "≈ {:,.4f} {}".format(convertedValue, "USD")
 					totalValue += convertedValue
 
 				embed.add_field(name=balanceText, value=valueText, inline=True)
@@ -230,29 +239,7 @@ class PaperCommand(BaseCommand):
 			lastResetTimestamp = paper.get("globalLastReset", 0)
 			resetCount = paper.get("globalResetCount", 0)
 
-			paperOrders1 = await self.database.collection(f"details/openPaperOrders/{request.accountId}").get()
-			paperOrders2 = await self.database.collection(f"details/openPaperOrders/{request.authorId}").get()
-
-			openOrdersValue = 0
-			for element in paperOrders1:
-				order = element.to_dict()
-				if order["orderType"] in ["buy", "sell"]:
-					currentPlatform = order["request"].get("currentPlatform")
-					task = order["request"].get(currentPlatform)
-					ticker = task.get("ticker").get("quote") if order["orderType"] == "buy" else task.get("ticker").get("base")
-					payload, responseMessage = await process_conversion(request, ticker, "USD", order["amount"] * (order["price"] if order["orderType"] == "buy" else 1), [currentPlatform], acceptable=["USD", "USDT", "BUSD"])
-					openOrdersValue += payload["raw"]["quotePrice"][0] if responseMessage is None else 0
-					assets.append((currentPlatform,  task.get("ticker").get("base")))
-			for element in paperOrders2:
-				order = element.to_dict()
-				if order["orderType"] in ["buy", "sell"]:
-					currentPlatform = order["request"].get("currentPlatform")
-					task = order["request"].get(currentPlatform)
-					ticker = task.get("ticker").get("quote") if order["orderType"] == "buy" else task.get("ticker").get("base")
-					payload, responseMessage = await process_conversion(request, ticker, "USD", order["amount"] * (order["price"] if order["orderType"] == "buy" else 1), [currentPlatform], acceptable=["USD", "USDT", "BUSD"])
-					openOrdersValue += payload["raw"]["quotePrice"][0] if responseMessage is None else 0
-					assets.append((currentPlatform,  task.get("ticker").get("base")))
-
+			openOrdersValue = valuation.openOrdersValue
 			if openOrdersValue > 0:
 				totalValue += openOrdersValue
 				valueText = "{:,.4f} USD".format(openOrdersValue)
@@ -317,29 +304,21 @@ class PaperCommand(BaseCommand):
 			request = await self.create_request(ctx)
 			if request is None: return
 
-			paperHistory = await self.database.collection(f"details/paperOrderHistory/{request.accountId}").limit(50).get()
-			if len(paperHistory) == 0:
+			# Only the fields shown in the history are fetched, newest fills first
+			fields = ["orderType", "amountText", "priceText", "timestamp", "request.currentPlatform"]
+			for platform in BaseCommand.sources["paper buy"]:
+				fields += [f"request.{platform}.ticker.base", f"request.{platform}.ticker.quote", f"request.{platform}.tickerRef"]
+			query = self.database.collection(f"details/paperOrderHistory/{request.accountId}").order_by("timestamp", direction=Query.DESCENDING).select(fields)
+
+			history = HistoryView(query, userId=request.authorId, icon=self.bot.user.avatar.url)
+			await history.load()
+			if len(history.orders) == 0:
 				embed = Embed(title="No paper trading history.", color=constants.colors["deep purple"])
 				embed.set_author(name="Paper Trader", icon_url=self.bot.user.avatar.url)
 				try: await ctx.respond(embed=embed)
 				except NotFound: pass
 			else:
-				embed = Embed(title="Paper trading history:", color=constants.colors["deep purple"])
-				embed.set_author(name="Paper Trader", icon_url=self.bot.user.avatar.url)
-
-				for element in paperHistory:
-					order = element.to_dict()
-					currentPlatform = order["request"].get("currentPlatform")
-					task = order["request"].get(currentPlatform)
-					ticker = task.get("ticker")
-
-					side = ""
-					if order["orderType"] == "buy": side = "Bought"
-					elif order["orderType"] == "sell": side = "Sold"
-					elif order["orderType"].startswith("stop"): side = "Stop sold"
-					embed.add_field(name=f"{side} {order['amountText']} {ticker.get('base')} at {order['priceText']} {ticker.get('quote')}", value=f"{timestamp_to_date(order['timestamp'] / 1000)}", inline=False)
-
-				try: await ctx.respond(embed=embed)
+				try: await ctx.respond(embed=await history.embed(), view=history)
 				except NotFound: pass
 
 		except CancelledError: pass
@@ -438,39 +417,30 @@ class PaperCommand(BaseCommand):
 					try: await ctx.interaction.edit_original_response(embed=embed, view=None)
 					except NotFound: pass
 
-					async def delete_collection(collectionRef, batchSize):
-						docs = await collectionRef.limit(batchSize).get()
-						deleted = 0
-
-						tasks = []
-						for doc in docs:
-							tasks.append(doc.reference.delete())
-							deleted += 1
-
-						await gather(*tasks)
-
-						if deleted == batchSize:
-							return await delete_collection(collectionRef, batchSize)
-
+					collections = [f"details/paperOrderHistory/{request.authorId}"]
 					if request.is_registered():
-						await wait([
-							create_task(delete_collection(self.database.collection(f"details/openPaperOrders/{request.accountId}"), 300)),
-							create_task(delete_collection(self.database.collection(f"details/paperOrderHistory/{request.accountId}"), 300)),
-						])
-
-					await wait([
-						create_task(delete_collection(self.database.collection(f"details/paperOrderHistory/{request.authorId}"), 300))
-					])
+						collections = [f"details/paperOrderHistory/{request.accountId}"] + collections
+					cutoff = int(time() * 1000)
 
 					if request.is_registered():
+						# Open orders go first, so that the order service can never fill an old order into the new balance
+						await quotas.clear("openPaperOrders", request.accountId)
 						await self.database.document(f"accounts/{request.accountId}").set({"paperTrader": DELETE_FIELD}, merge=True)
 					else:
 						await self.database.document(f"discord/properties/users/{request.authorId}").set({"paperTrader": DELETE_FIELD}, merge=True)
+					accountProperties.invalidate(request.accountId, request.authorId)
+					valuations.invalidate(request.accountId, request.authorId)
 
-					embed = Embed(title="Paper balance has been reset successfully.", color=constants.colors["deep purple"])
-					embed.set_author(name="Paper Trader", icon_url=self.bot.user.avatar.url)
-					try: await ctx.interaction.edit_original_response(embed=embed)
-					except NotFound: pass
+					async def report_progress(deleted, finished):
+						if finished:
+							embed = Embed(title="Paper balance has been reset successfully.", color=constants.colors["deep purple"])
+							embed.set_author(name="Paper Trader", icon_url=self.bot.user.avatar.url)
+						else:
+							embed = Embed(description=f"Deleting your paper trading history ... {deleted:,} order{'' if deleted == 1 else 's'} removed so far.", color=constants.colors["deep purple"])
+						await ctx.interaction.edit_original_response(embed=embed)
+
+					# History is removed in the background, so the interaction doesn't stay open for large histories
+					await bulkDeleter.submit(collections, cutoff, progress=report_progress)
 
 		except CancelledError: pass
 		except:
@@ -507,14 +477,7 @@ class PaperCommand(BaseCommand):
 		else:
 			execPriceText = "{:,.6f}".format(execPrice)
 			execAmountText = "{:,.6f}".format(execAmount)
-			async with ClientSession() as session:
-				if ticker['exchange'].get("id") is not None and ticker['exchange']['id'] != "forex":
-					url = f"https://api.twelvedata.com/logo?apikey={environ['TWELVEDATA_KEY']}&interval=1min&type={ticker['metadata']['type'].replace(' ', '%20')}&format=JSON&symbol={ticker.get('symbol')}&exchange={ticker['exchange']['name']}"
-				else:
-					url = f"https://api.twelvedata.com/logo?apikey={environ['TWELVEDATA_KEY']}&interval=1min&type={ticker['metadata']['type'].replace(' ', '%20')}&format=JSON&symbol={ticker.get('symbol')}"
-				async with session.get(url) as resp:
-					response = await resp.json()
-					thumbnailUrl = response.get("url")
+			thumbnailUrl = await logos.get(ticker)
 
 		baseValue = execAmount
 		quoteValue = execAmount * execPrice
@@ -551,6 +514,24 @@ class PaperCommand(BaseCommand):
 
 		return None, None, paper, Order(newOrder, priceText=priceText, conversionText=conversionText, amountText=execAmountText)
 
+	async def paper_properties(self, request):
+		properties = await DatabaseConnector(mode="account").get(request.accountId if request.is_registered() else request.authorId)
+		paper = (properties or {}).get("paperTrader", {})
+		if "balance" not in paper:
+			paper["balance"] = {"USD": 10000, "CCXT": {}, "Twelvedata": {}}
+		return paper
+
+	def covers(self, paper, orderType, currentPlatform, request, pendingOrder):
+		ticker = request.get("ticker")
+		asset = ticker.get("base") if orderType.endswith("sell") else ticker.get("quote")
+		if asset in ["USD", "USDT", "USDC", "DAI", "HUSD", "TUSD", "PAX", "USDK", "USDN", "BUSD", "GUSD", "USDS"]:
+			balance = paper["balance"].get("USD", 0)
+		else:
+			balance = paper["balance"].get(currentPlatform, {}).get(asset, 0)
+		required = pendingOrder.parameters["amount"] if orderType.endswith("sell") else pendingOrder.parameters["amount"] * pendingOrder.parameters["price"]
+		# Allows for the rounding of formatted prices and amounts
+		return balance >= required * 0.999999
+
 	def post_trade(self, paper, orderType, currentPlatform, request, payload, pendingOrder):
 		ticker = request.get("ticker")
 		execPrice = pendingOrder.parameters["price"]
@@ -582,6 +563,59 @@ class PaperCommand(BaseCommand):
 		return paper
 
 
+class HistoryView(View):
+	def __init__(self, query, userId, icon, pageSize=10):
+		super().__init__(timeout=600)
+		self.query = query
+		self.userId = userId
+		self.icon = icon
+		self.pageSize = pageSize
+		# Cursors are the last document of the preceding page, None for the first page
+		self.cursor = None
+		self.cursors = []
+		self.orders = []
+
+	async def load(self):
+		query = self.query if self.cursor is None else self.query.start_after(self.cursor)
+		# One extra document tells whether there is a next page
+		orders = await query.limit(self.pageSize + 1).get()
+		self.orders = orders[:self.pageSize]
+		self.previous.disabled = len(self.cursors) == 0
+		self.next.disabled = len(orders) <= self.pageSize
+
+	async def embed(self):
+		orders = [element.to_dict() for element in self.orders]
+		tasks = await gather(*[tickerRegistry.expand(order["request"].get(order["request"].get("currentPlatform"))) for order in orders])
+
+		embed = Embed(title="Paper trading history:", color=constants.colors["deep purple"])
+		embed.set_author(name="Paper Trader", icon_url=self.icon)
+		for order, task in zip(orders, tasks):
+			ticker = task.get("ticker")
+
+			side = ""
+			if order["orderType"] == "buy": side = "Bought"
+			elif order["orderType"] == "sell": side = "Sold"
+			elif order["orderType"].startswith("stop"): side = "Stop sold"
+			embed.add_field(name=f"{side} {order['amountText']} {ticker.get('base')} at {order['priceText']} {ticker.get('quote')}", value=f"{timestamp_to_date(order['timestamp'] / 1000)}", inline=False)
+		embed.set_footer(text=f"Page {len(self.cursors) + 1}")
+		return embed
+
+	@button(label="Previous", style=ButtonStyle.secondary)
+	async def previous(self, button: Button, interaction: Interaction):
+		if self.userId != interaction.user.id: return
+		self.cursor = self.cursors.pop()
+		await self.load()
+		await interaction.response.edit_message(embed=await self.embed(), view=self)
+
+	@button(label="Next", style=ButtonStyle.secondary)
+	async def next(self, button: Button, interaction: Interaction):
+		if self.userId != interaction.user.id: return
+		self.cursors.append(self.cursor)
+		self.cursor = self.orders[-1]
+		await self.load()
+		await interaction.response.edit_message(embed=await self.embed(), view=self)
+
+
 class Order(object):
 	def __init__(self, parameters, priceText, amountText, conversionText):
 		self.parameters = parameters
@@ -608,7 +642,7 @@ class DeleteView(View):
 		order = order.to_dict()
 
 		currentPlatform = order["request"].get("currentPlatform")
-		request = order["request"].get(currentPlatform)
+		request = await tickerRegistry.expand(order["request"].get(currentPlatform))
 		ticker = request.get("ticker")
 
 		base = ticker.get("base")
@@ -629,8 +663,10 @@ class DeleteView(View):
 		elif order["orderType"] == "sell":
 			baseBalance[base] += order["amount"]
 
-		await self.database.document(f"details/openPaperOrders/{self.pathId}/{self.orderId}").delete()
+		await quotas.remove("openPaperOrders", self.pathId, self.orderId)
 		await self.database.document(f"accounts/{self.pathId}").set({"paperTrader": properties["paperTrader"]}, merge=True)
+		accountProperties.invalidate(self.pathId, self.userId)
+		valuations.invalidate(self.pathId)
 
 		embed = Embed(title="Paper order has been canceled.", color=constants.colors["gray"])
 		await interaction.response.edit_message(embed=embed, view=None)
\ No newline at end of file
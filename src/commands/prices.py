@@ -7,9 +7,10 @@ from discord import Embed
 from discord.embeds import EmptyEmbed
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 
 from helpers import constants
+from helpers.statistics import statistics
+from helpers.conversions import conversions
 from assets import static_storage
 from Processor import process_quote_arguments, process_task
 
@@ -40,6 +41,7 @@ class PriceCommand(BaseCommand):
 					embed.set_author(name=payload["title"], icon_url=payload.get("thumbnailUrl"))
 					embed.set_footer(text=payload["sourceText"])
 				else:
+					conversions.observe_quote(currentTask.get("ticker"), payload)
 					embed = Embed(title="{}{}".format(payload["quotePrice"], f" *({payload['change']})*" if "change" in payload else ""), description=payload.get("quoteConvertedPrice", EmptyEmbed), color=constants.colors[payload["messageColor"]])
 					embed.set_author(name=payload["title"], icon_url=payload.get("thumbnailUrl"))
 					embed.set_footer(text=payload["sourceText"])
@@ -52,7 +54,7 @@ class PriceCommand(BaseCommand):
 		except NotFound: pass
 		request.set_delay("response", time() - requestCheckpoint)
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"p": Increment(len(tasks))}}, merge=True)
+		statistics.increment(request.snapshot, "p", len(tasks))
 		await self.log_request("prices", request, tasks, telemetry=request.telemetry)
 
 	@slash_command(name="p", description="Fetch stock and crypto prices, forex rates, and other instrument data. Command for power users.")
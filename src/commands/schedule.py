@@ -14,9 +14,10 @@ from discord.ui import View, button, Button, Select
 from discord.errors import NotFound
 from google.cloud.firestore import Increment
 from google.cloud.firestore_v1.base_query import FieldFilter
-from pycoingecko import CoinGeckoAPI
 
 from helpers import constants
+from helpers.quotas import quotas
+from helpers.http import get_coins_markets
 from assets import static_storage
 from Processor import process_chart_arguments, process_heatmap_arguments, process_quote_arguments, process_task, autocomplete_hmap_timeframe, autocomplete_market, autocomplete_category, autocomplete_size, autocomplete_group, autocomplete_layout_timeframe
 from commands.heatmaps import autocomplete_theme
@@ -84,7 +85,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -98,7 +99,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -198,7 +199,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": arguments,
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -251,7 +252,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -265,7 +266,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -360,7 +361,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": [url, tickerId, venue, timeframe],
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -416,7 +417,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -430,7 +431,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -519,7 +520,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": arguments,
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -570,7 +571,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -584,7 +585,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -674,7 +675,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": [tickerId, venue],
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -725,7 +726,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -739,7 +740,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -823,7 +824,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": [tickerId, venue],
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -874,7 +875,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -888,7 +889,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -927,16 +928,10 @@ class ScheduleCommand(BaseCommand):
 
 				embeds = []
 				if category == "crypto gainers":
-					rawData = []
-					cg = CoinGeckoAPI(api_key=environ["COINGECKO_API_KEY"])
-					page = 1
-					while True:
-						rawData += cg.get_coins_markets(vs_currency="usd", order="market_cap_desc", per_page=250, page=page, price_change_percentage="24h")
-						page += 1
-						if page > 4: break
+					rawData = await get_coins_markets(max(10, min(limit, 1000)))
 
 					response = []
-					for e in rawData[:max(10, limit)]:
+					for e in rawData:
 						if e.get("price_change_percentage_24h_in_currency", None) is not None:
 							response.append({"symbol": e["symbol"].upper(), "change": e["price_change_percentage_24h_in_currency"]})
 					response = sorted(response, key=lambda k: k["change"], reverse=True)[:10]
@@ -947,16 +942,10 @@ class ScheduleCommand(BaseCommand):
 					embeds.append(embed)
 
 				elif category == "crypto losers":
-					rawData = []
-					cg = CoinGeckoAPI(api_key=environ["COINGECKO_API_KEY"])
-					page = 1
-					while True:
-						rawData += cg.get_coins_markets(vs_currency="usd", order="market_cap_desc", per_page=250, page=page, price_change_percentage="24h")
-						page += 1
-						if page > 4: break
+					rawData = await get_coins_markets(max(10, min(limit, 1000)))
 
 					response = []
-					for e in rawData[:max(10, limit)]:
+					for e in rawData:
 						if e.get("price_change_percentage_24h_in_currency", None) is not None:
 							response.append({"symbol": e["symbol"].upper(), "change": e["price_change_percentage_24h_in_currency"]})
 					response = sorted(response, key=lambda k: k["change"])[:10]
@@ -995,7 +984,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": [category, str(limit)],
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -1045,7 +1034,7 @@ class ScheduleCommand(BaseCommand):
 			try: await ctx.defer(ephemeral=True)
 			except: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			postLimitReached = await quotas.exceeds("scheduledPosts", [request.guildId], 100)
 
 			if isinstance(ctx.channel, Thread):
 				embed = Embed(title="You cannot schedule a post in a thread.", color=constants.colors["gray"])
@@ -1059,7 +1048,7 @@ class ScheduleCommand(BaseCommand):
 				try: await ctx.interaction.edit_original_response(embed=embed)
 				except NotFound: pass
 
-			elif totalPostCount[0][0].value >= 100:
+			elif postLimitReached:
 				embed = Embed(title="You can only create up to 100 scheduled posts per community. Remove some before creating new ones by calling </schedule list:1041362666872131675>", color=constants.colors["red"])
 				embed.set_author(name="Maximum number of scheduled posts reached", icon_url=static_storage.error_icon)
 				try: await ctx.interaction.edit_original_response(embed=embed)
@@ -1163,7 +1152,7 @@ class ScheduleCommand(BaseCommand):
 					avatar = await self.bot.user.avatar.read()
 					webhook = await ctx.channel.create_webhook(name=self.bot.user.name, avatar=avatar)
 
-				await self.database.document(f"details/scheduledPosts/{request.guildId}/{str(uuid4())}").set({
+				await quotas.add("scheduledPosts", request.guildId, str(uuid4()), {
 					"arguments": ["fgi", assetType],
 					"authorId": str(request.authorId),
 					"botId": str(self.bot.user.id),
@@ -1201,16 +1190,16 @@ class ScheduleCommand(BaseCommand):
 			request = await self.create_request(ctx)
 			if request is None: return
 
-			totalPostCount = await self.database.collection(f"details/scheduledPosts/{request.guildId}").count().get()
+			totalPostCount = await quotas.count("scheduledPosts", request.guildId)
 
-			if totalPostCount[0][0].value == 0:
+			if totalPostCount == 0:
 				embed = Embed(title="You haven't set any scheduled posts yet.", color=constants.colors["gray"])
 				embed.set_author(name="Scheduled Posts", icon_url=static_storage.error_icon)
 				try: await ctx.respond(embed=embed, ephemeral=True)
 				except NotFound: pass
 
 			else:
-				embed = Embed(title=f"You've created {totalPostCount[0][0].value} scheduled post{'' if totalPostCount[0][0].value == 1 else 's'} in this community. You can manage them on the community dashboard.", color=constants.colors["light blue"])
+				embed = Embed(title=f"You've created {totalPostCount} scheduled post{'' if totalPostCount == 1 else 's'} in this community. You can manage them on the community dashboard.", color=constants.colors["light blue"])
 				try: await ctx.respond(embed=embed, view=RedirectView(f"https://www.alpha.bot/communities/{request.guildId}?tab=2"), ephemeral=True)
 				except NotFound: pass
 
@@ -1231,6 +1220,7 @@ class DeleteView(View):
 	@button(label="Delete", style=ButtonStyle.danger)
 	async def delete(self, button: Button, interaction: Interaction):
 		if self.userId != interaction.user.id: return
-		await self.database.document(self.pathId).delete()
+		_, guildId, postId = self.pathId.rsplit("/", 2)
+		await quotas.remove("scheduledPosts", guildId, postId)
 		embed = Embed(title="Scheduled post deleted", color=constants.colors["gray"])
 		await interaction.response.edit_message(embed=embed, view=None)
\ No newline at end of file
@@ -6,9 +6,9 @@ from discord import Embed
 from discord.embeds import EmptyEmbed
 from discord.commands import slash_command, Option
 from discord.errors import NotFound
-from google.cloud.firestore import Increment
 
 from helpers import constants
+from helpers.statistics import statistics
 from assets import static_storage
 from Processor import process_quote_arguments, process_task
 
@@ -39,7 +39,7 @@ class VolumeCommand(BaseCommand):
 			try: await ctx.interaction.edit_original_response(embed=embed)
 			except NotFound: pass
 
-		await self.database.document("discord/statistics").set({request.snapshot: {"v": Increment(1)}}, merge=True)
+		statistics.increment(request.snapshot, "v")
 		await self.log_request("volume", request, [task])
 
 	@slash_command(name="volume", description="Fetch stock and crypto 24-hour volume.")
@@ -1,24 +1,43 @@
 from os import environ, _exit
+from signal import SIGTERM
 environ["PRODUCTION"] = environ["PRODUCTION"] if "PRODUCTION" in environ and environ["PRODUCTION"] else ""
 botId = -1 if len(environ["HOSTNAME"].split("-")) != 3 else int(environ["HOSTNAME"].split("-")[-1])
 
 from time import time
 from datetime import datetime, timezone
-from requests import post
-from asyncio import CancelledError, sleep, gather, wait, create_task
+from asyncio import CancelledError, sleep, gather
 from traceback import format_exc
 
 from discord import AutoShardedBot, Embed, Intents, Activity, Status, ActivityType, MessageType
 from discord.ext import tasks
-from discord.errors import NotFound
+from discord.errors import NotFound, Forbidden
 from google.cloud.firestore import AsyncClient as FirestoreAsyncClient
 from google.cloud.firestore import Client as FirestoreClient
-from google.cloud.firestore import Increment
+from google.cloud.firestore import DELETE_FIELD
 from google.cloud.firestore import Query
+from google.cloud.firestore_v1.base_query import FieldFilter
 from google.cloud.error_reporting import Client as ErrorReportingClient
 
 from assets import static_storage
 from helpers import constants
+from helpers.cache import accountProperties
+from helpers.guilds import GuildMirror, GuildMetadataFetcher
+from helpers.statistics import statistics
+from helpers.telemetry import publisher
+from helpers.scheduler import scheduler
+from helpers.delivery import DeliveryQueue
+from helpers.bridge import SnapshotBridge, VersionedSnapshot
+from helpers.resolver import DiscordResolver
+from helpers.reconciler import GuildReconciler
+from helpers.http import http
+from helpers.logos import logos
+from helpers.alerts import alertIndex
+from helpers.quotas import quotas
+from helpers.triggers import triggers, QuoteFeed
+from helpers.tickers import tickerRegistry
+from helpers.valuation import valuations
+from helpers.conversions import conversions
+from helpers.jobs import bulkDeleter
 
 from DatabaseConnector import DatabaseConnector
 from CommandRequest import CommandRequest
@@ -74,10 +93,13 @@ async def on_guild_join(guild):
 		if guild.id in constants.bannedGuilds:
 			await guild.leave()
 			return
-		properties = await guild_secure_fetch(guild.id)
+		# The mirror only keeps the fields commands read, while the whole document is written back here
+		properties = await database.document(f"discord/properties/guilds/{guild.id}").get()
+		properties = properties.to_dict() or {}
 		properties.pop("connection", None)
 		properties = CommandRequest.create_guild_settings(properties)
 		await database.document(f"discord/properties/guilds/{guild.id}").set(properties)
+		guildMirror.update(guild.id, properties)
 		await update_guild_count()
 	except:
 		print(format_exc())
@@ -91,11 +113,27 @@ async def on_guild_remove(guild):
 		return
 
 	try:
+		untrack_nickname(str(guild.id))
+		guildMirror.drop(guild.id)
 		await update_guild_count()
 	except:
 		print(format_exc())
 		if environ["PRODUCTION"]: logging.report_exception(user=str(guild.id))
 
+@bot.event
+async def on_guild_update(before, after):
+	# Method should not run on licensed bots
+	if bot.user.id not in constants.PRIMARY_BOTS: return
+	if before.name != after.name:
+		track_nickname(after)
+
+@bot.event
+async def on_member_update(before, after):
+	# Method should not run on licensed bots
+	if bot.user.id not in constants.PRIMARY_BOTS: return
+	if after.id == bot.user.id and before.nick != after.nick:
+		track_nickname(after.guild)
+
 @tasks.loop(hours=8.0)
 async def update_guild_count():
 	# Method should not run on licensed bots
@@ -105,7 +143,7 @@ async def update_guild_count():
 
 	t = datetime.now().astimezone(timezone.utc)
 	await database.document("discord/statistics").set({"{}-{:02d}".format(t.year, t.month): {"servers": len(bot.guilds)}}, merge=True)
-	post(f"https://top.gg/api/bots/{bot.user.id}/stats", data={"server_count": len(bot.guilds)}, headers={"Authorization": environ["TOPGG_KEY"]})
+	await http.post(f"https://top.gg/api/bots/{bot.user.id}/stats", data={"server_count": len(bot.guilds)}, headers={"Authorization": environ["TOPGG_KEY"]})
 
 @tasks.loop(hours=12.0)
 async def update_paid_guilds():
@@ -121,7 +159,6 @@ async def update_paid_guilds():
 	try:
 		response = await database.collection("accounts").order_by("customer.subscriptions", direction=Query.DESCENDING).limit(200).get()
 		ids = set()
-		guilds = []
 
 		for account in response:
 			if account.id in BLACKLIST: continue
@@ -129,14 +166,12 @@ async def update_paid_guilds():
 
 			for feature in properties["customer"]["slots"]:
 				for guildId in properties["customer"]["slots"][feature].keys():
-					if guildId != "personal" and guildId not in ids:
+					if guildId != "personal":
 						ids.add(guildId)
-						try: guild = await bot.fetch_guild(int(guildId), with_counts=True)
-						except: continue
-						guilds.append(guild)
 
-		guilds.sort(key=lambda g: g.approximate_member_count, reverse=True)
-		icons = [{"url": g.icon.url, "name": g.name, "members": g.approximate_member_count} for g in guilds if g is not None and g.icon is not None]
+		guilds = await guildMetadata.get_many(ids)
+		icons = [g for g in guilds if g is not None and g["url"] is not None]
+		icons.sort(key=lambda g: g["members"] or 0, reverse=True)
 
 		await database.document("examples/servers").set({"paid": icons})
 	except:
@@ -150,7 +185,8 @@ async def update_paid_guilds():
 
 def update_settings(s, changes, timestamp):
 	global settings
-	settings = s[0].to_dict()
+	# Readers keep whichever immutable snapshot they started with
+	settings = VersionedSnapshot(s[0].to_dict(), settings.version + 1)
 
 
 # -------------------------
@@ -165,16 +201,13 @@ def process_messages(pendingMessages, changes, timestamp):
 		for change in changes:
 			message = change.document.to_dict()
 			if change.type.name in ["ADDED", "MODIFIED"]:
-				bot.loop.create_task(send_messages(change.document.id, message))
+				delivery.submit(change.document.id, message)
 
 	except:
 		print(format_exc())
 		if environ["PRODUCTION"]: logging.report_exception()
 
 async def send_messages(messageId, message):
-	# Method should only run if the message is addressed to the right bot
-	if message["botId"] != str(bot.user.id): return
-
 	await bot.wait_until_ready()
 
 	try:
@@ -194,43 +227,34 @@ async def send_messages(messageId, message):
 		backupChannel = None
 		error = ""
 
+		# Destinations and backups are resolved together, and DM channels are cached between alerts
 		if message.get("user") is not None:
-			try:
-				destinationUser = bot.get_user(int(message["user"]))
-				if destinationUser is None:
-					destinationUser = await bot.fetch_user(int(message["user"]))
-			except: print(format_exc())
-			try:
-				backupChannel = bot.get_channel(int(message["backupChannel"]))
-				if backupChannel is None:
-					backupChannel = await bot.fetch_channel(int(message["backupChannel"]))
-			except: print(format_exc())
+			destinationUser, backupChannel = await gather(
+				resolver.dm(message["user"]),
+				resolver.channel(message.get("backupChannel"))
+			)
 		else:
-			try:
-				destinationChannel = bot.get_channel(int(message["channel"]))
-				if destinationChannel is None:
-					destinationChannel = await bot.fetch_channel(int(message["channel"]))
-			except: print(format_exc())
-			try:
-				backupUser = bot.get_user(int(message["backupUser"]))
-				if backupUser is None:
-					backupUser = await bot.fetch_user(int(message["backupUser"]))
-			except: print(format_exc())
+			destinationChannel, backupUser = await gather(
+				resolver.channel(message.get("channel")),
+				resolver.dm(message.get("backupUser"))
+			)
 
 		if destinationUser is not None:
 			try:
 				await destinationUser.send(embed=embed)
-				await database.document(f"discord/properties/messages/{messageId}").delete()
-				return
+				return True
+			except Forbidden:
+				resolver.mark_unreachable(destinationUser)
+				destinationUser = None
 			except:
 				print(format_exc())
 		elif destinationChannel is not None:
 			try:
 				await destinationChannel.send(content=content, embed=embed)
-				await database.document(f"discord/properties/messages/{messageId}").delete()
-				return
+				return True
 			except Exception as e:
 				print(format_exc())
+				if isinstance(e, (Forbidden, NotFound)): resolver.mark_unreachable(destinationChannel)
 				error = e.text.lower() if hasattr(e, 'text') else str(e)
 				print(error)
 
@@ -238,15 +262,15 @@ async def send_messages(messageId, message):
 			try:
 				mentionText = f"<@!{message['user']}>, you weren't reachable via DMs!" if destinationUser is None else None
 				await backupChannel.send(content=mentionText, embed=embed)
-				await database.document(f"discord/properties/messages/{messageId}").delete()
-				return
+				return True
 			except:
 				print(format_exc())
 		elif backupUser is not None:
 			try:
 				await backupUser.send(content=f"The alert could not be sent into the channel that was initially requested. Reason: `{error}`", embed=embed)
-				await database.document(f"discord/properties/messages/{messageId}").delete()
-				return
+				return True
+			except Forbidden:
+				resolver.mark_unreachable(backupUser)
 			except:
 				print(format_exc())
 
@@ -255,12 +279,49 @@ async def send_messages(messageId, message):
 	except:
 		print(format_exc())
 		if environ["PRODUCTION"]: logging.report_exception()
+	return False
 
 
 # -------------------------
 # Job functions
 # -------------------------
 
+def track_nickname(guild):
+	guildId = str(guild.id)
+	current = nicknameChanges.get(guildId, settings.get("nicknames", {}).get(guildId))
+	if current is DELETE_FIELD: current = None
+
+	if guild.me is None or guild.me.nick is None or guild.member_count < 10:
+		if current is not None:
+			nicknameChanges[guildId] = DELETE_FIELD
+	elif current is None or current.get("nickname") != guild.me.nick or current.get("server name") != guild.name:
+		nicknameChanges[guildId] = {"nickname": guild.me.nick, "server name": guild.name, "allowed": None}
+
+def untrack_nickname(guildId):
+	if nicknameChanges.get(guildId, settings.get("nicknames", {}).get(guildId)) not in [None, DELETE_FIELD]:
+		nicknameChanges[guildId] = DELETE_FIELD
+
+@tasks.loop(seconds=30.0)
+async def flush_nicknames():
+	global nicknameChanges
+	if len(nicknameChanges) == 0: return
+	changes, nicknameChanges = nicknameChanges, {}
+
+	try:
+		if environ["PRODUCTION"]:
+			# Only the changed nicknames.<guildId> fields are written
+			await database.document("discord/settings").set({"nicknames": changes}, merge=True)
+	except:
+		for guildId, change in changes.items():
+			nicknameChanges.setdefault(guildId, change)
+		print(format_exc())
+		if environ["PRODUCTION"]: logging.report_exception()
+
+@tasks.loop(minutes=60.0)
+async def report_cache_statistics():
+	print(f"Conversion rate cache: {conversions.stats()}")
+	print(f"Message delivery: {delivery.stats()}")
+
 @tasks.loop(minutes=60.0)
 async def security_check():
 	# Method should not run on licensed bots
@@ -269,34 +330,21 @@ async def security_check():
 	if len(bot.guilds) < 25000: return
 
 	try:
-		guildIds = [str(e.id) for e in bot.guilds]
+		guilds = list(bot.guilds)
+		guildIds = {str(guild.id) for guild in guilds}
 
-		for guildId in list(settings["nicknames"].keys()):
-			if guildId not in guildIds:
-				settings["nicknames"].pop(guildId)
+		for guildId in settings.get("nicknames", {}).keys() - guildIds:
+			untrack_nickname(guildId)
 
-		for guild in bot.guilds:
+		for i, guild in enumerate(guilds):
 			if guild.id in constants.bannedGuilds:
 				await guild.leave()
-			if guild.member_count < 10:
-				if guildId in settings["nicknames"]:
-					settings["nicknames"].pop(guildId)
 				continue
+			track_nickname(guild)
+			# Reconciliation is a safety net for missed gateway events, so it yields to the event loop regularly
+			if i % 1000 == 999: await sleep(0)
 
-			guildId = str(guild.id)
-			if guild.me is not None:
-				if guildId in settings["nicknames"]:
-					if guild.me.nick is None:
-						settings["nicknames"].pop(guildId)
-					elif settings["nicknames"][guildId].get("nickname") != guild.me.nick or settings["nicknames"][guildId]["server name"] != guild.name:
-						settings["nicknames"][guildId] = {"nickname": guild.me.nick, "server name": guild.name, "allowed": None}
-				elif guild.me.nick is not None:
-					settings["nicknames"][guildId] = {"nickname": guild.me.nick, "server name": guild.name, "allowed": None}
-			elif guildId in settings["nicknames"]:
-				settings["nicknames"].pop(guildId)
-
-		if environ["PRODUCTION"]:
-			await database.document("discord/settings").set(settings)
+		await flush_nicknames()
 
 	except CancelledError: pass
 	except:
@@ -311,32 +359,25 @@ async def database_sanity_check():
 	if not environ["PRODUCTION"] or len(bot.guilds) < 25000: return
 
 	try:
-		databaseKeys = set(await guildProperties.keys())
+		databaseKeys = await guildProperties.keys()
 		if databaseKeys is None: return
 
-		guilds = set([str(g.id) for g in bot.guilds])
-		difference = guilds.symmetric_difference(databaseKeys)
-
-		tasks = []
-		for guildId in difference:
-			if guildId not in guilds and int(guildId) not in constants.LICENSED_BOTS:
-				tasks.append(create_task(database.document(f"discord/properties/guilds/{guildId}").set({"stale": {"count": Increment(1), "timestamp": time()}}, merge=True)))
-
-		for guildId in difference:
-			if guildId not in databaseKeys:
-				properties = await guild_secure_fetch(guildId)
-				if not properties:
-					tasks.append(create_task(database.document(f"discord/properties/guilds/{guildId}").set(CommandRequest.create_guild_settings({}))))
-
-		if len(tasks) > 0:
-			await wait(tasks)
+		await guildReconciler.run((g.id for g in bot.guilds), databaseKeys, excluded=constants.LICENSED_BOTS)
 
 	except:
 		print(format_exc())
 		if environ["PRODUCTION"]: logging.report_exception()
 
+async def guild_properties(guildId):
+	if guildMirror.is_ready():
+		return guildMirror.get(guildId, {})
+	return await guildProperties.get(guildId, {})
+
 async def guild_secure_fetch(guildId):
-	properties = await guildProperties.get(guildId)
+	if guildMirror.is_ready():
+		properties = guildMirror.get(guildId)
+	else:
+		properties = await guildProperties.get(guildId)
 
 	if properties is None:
 		properties = await database.document(f"discord/properties/guilds/{guildId}").get()
@@ -378,7 +419,7 @@ async def on_message(message):
 
 		if commandRequest.content.startswith("x "):
 			await process_ichibot_command(message, commandRequest, commandRequest.content.split(" ", 1)[1])
-			await database.document("discord/statistics").set({_snapshot: {"x": Increment(1)}}, merge=True)
+			statistics.increment(_snapshot, "x")
 
 	except CancelledError: pass
 	except:
@@ -447,7 +488,7 @@ async def create_request(ctx, autodelete=-1):
 	[accountId, user, guild] = await gather(
 		accountProperties.match(authorId),
 		accountProperties.get(str(authorId), {}),
-		guildProperties.get(guildId, {})
+		guild_properties(guildId)
 	)
 	databaseCheckpoint = time()
 
@@ -476,6 +517,7 @@ async def create_request(ctx, autodelete=-1):
 			forceFetch = await database.document(f"discord/properties/guilds/{request.guildId}").get()
 			forcedFetch = CommandRequest.create_guild_settings(forceFetch.to_dict())
 			if forcedFetch["settings"]["setup"]["completed"]:
+				guildMirror.update(request.guildId, forcedFetch)
 				request.guildProperties = forcedFetch
 				return request
 			elif not ctx.bot and ctx.interaction.permissions.administrator:
@@ -533,13 +575,21 @@ async def unknown_error(ctx, authorId):
 # Startup
 # -------------------------
 
-settings = {}
-accountProperties = DatabaseConnector(mode="account")
+settings = VersionedSnapshot({})
+nicknameChanges = {}
+bridge = SnapshotBridge(bot.loop)
+accountProperties.start(DatabaseConnector(mode="account"))
 guildProperties = DatabaseConnector(mode="guild")
+guildMirror = GuildMirror()
+guildMetadata = GuildMetadataFetcher(bot)
+delivery = DeliveryQueue(send_messages, database)
+resolver = DiscordResolver(bot)
+guildReconciler = GuildReconciler(database, guild_secure_fetch, CommandRequest.create_guild_settings)
 Ichibot.logging = logging
 
-discordSettingsLink = snapshots.document("discord/settings").on_snapshot(update_settings)
-discordMessagesLink = snapshots.collection("discord/properties/messages").on_snapshot(process_messages)
+discordSettingsLink = bridge.listen(snapshots.document("discord/settings"), update_settings)
+discordMessagesLink = None
+guildInvalidationsLink = None
 
 @bot.event
 async def on_ready():
@@ -555,12 +605,46 @@ async def on_ready():
 		if environ["PRODUCTION"]: logging.report_exception()
 		_exit(1)
 
+	statistics.start(database, str(bot.user.id))
+	publisher.start()
+	scheduler.start(bot.http, database, snapshots, str(bot.user.id), bridge)
+	delivery.start()
+	logos.start(database)
+	tickerRegistry.start(database)
+	valuations.start(database)
+	conversions.start()
+	bulkDeleter.start(database, str(bot.user.id))
+	alertIndex.start(database)
+	quotas.start(database)
+	# Alerts are triggered by a separate service unless the local engine is explicitly enabled
+	if environ.get("LOCAL_ALERT_TRIGGERS"):
+		triggers.start(delivery.submit, database, str(bot.user.id), feed=QuoteFeed())
+
+	global discordMessagesLink
+	if discordMessagesLink is None:
+		# Each bot only listens to messages addressed to it
+		discordMessagesLink = bridge.listen(snapshots.collection("discord/properties/messages").where(filter=FieldFilter("botId", "==", str(bot.user.id))), process_messages)
+
+	if bot.user.id in constants.PRIMARY_BOTS:
+		guildMirror.start(database, [guild.id for guild in bot.guilds])
+	else:
+		guildMirror.start(database, constants.LICENSED_BOTS)
+
+	global guildInvalidationsLink
+	if guildInvalidationsLink is None:
+		# Only changes made after startup matter, everything older was already read by the mirror
+		guildInvalidationsLink = bridge.listen(snapshots.collection("discord/properties/invalidations").where(filter=FieldFilter("timestamp", ">", time())), guildMirror.process_invalidations)
+
 	if not update_guild_count.is_running():
 		update_guild_count.start()
 	if not update_paid_guilds.is_running():
 		update_paid_guilds.start()
 	if not security_check.is_running():
 		security_check.start()
+	if not flush_nicknames.is_running():
+		flush_nicknames.start()
+	if not report_cache_statistics.is_running():
+		report_cache_statistics.start()
 	if not database_sanity_check.is_running():
 		database_sanity_check.start()
 
@@ -589,4 +673,17 @@ elif botId == 4:
 elif botId == 5:
 	token = environ["LY69ID57NRBR26T7QGZFBY7BY2E3_TOKEN"]
 
-bot.loop.run_until_complete(bot.start(token))
\ No newline at end of file
+async def shutdown():
+	await statistics.close()
+	await flush_nicknames()
+	await publisher.close()
+	await scheduler.close()
+	await triggers.close()
+	await delivery.close()
+	await logos.close()
+	await conversions.close()
+	await http.close()
+
+bot.loop.add_signal_handler(SIGTERM, lambda: bot.loop.create_task(bot.close()))
+try: bot.loop.run_until_complete(bot.start(token))
+finally: bot.loop.run_until_complete(shutdown())
\ No newline at end of file
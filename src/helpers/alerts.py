@@ -0,0 +1,98 @@
+from hashlib import sha1
+from bisect import bisect_left, insort
+from orjson import dumps, OPT_SORT_KEYS
+
+from helpers.cache import LoadingCache
+
+
+def ticker_hash(ticker):
+	# Logos and parser trees are attached to tickers after the fact and don't identify the market
+	canonical = {key: value for key, value in ticker.items() if key not in ["image", "tree"]}
+	return sha1(dumps(canonical, option=OPT_SORT_KEYS)).hexdigest()
+
+def ticker_reference(task):
+	# Compact documents reference the ticker registry, older ones carry the full ticker
+	tickerId = task.get("tickerRef")
+	return ticker_hash(task.get("ticker")) if tickerId is None else tickerId
+
+
+class OwnerAlerts(object):
+	__slots__ = ("levels", "alerts")
+
+	def __init__(self):
+		# Canonical ticker hash -> sorted list of (level, levelText)
+		self.levels = {}
+		# Alert id -> (ticker hash, level, levelText)
+		self.alerts = {}
+
+	def add(self, alertId, alert):
+		self.remove(alertId)
+		tickerId = ticker_reference(alert["request"])
+		entry = (alert["level"], alert.get("levelText", str(alert["level"])))
+		insort(self.levels.setdefault(tickerId, []), entry)
+		self.alerts[alertId] = (tickerId, *entry)
+
+	def remove(self, alertId):
+		entry = self.alerts.pop(alertId, None)
+		if entry is None: return
+		tickerId, level, levelText = entry
+		levels = self.levels[tickerId]
+		levels.pop(bisect_left(levels, (level, levelText)))
+		if len(levels) == 0: self.levels.pop(tickerId)
+
+	def find(self, tickerId, level):
+		levels = self.levels.get(tickerId)
+		if levels is None: return None, None
+
+		i = bisect_left(levels, (level,))
+		if i < len(levels) and levels[i][0] == level:
+			return "exact", levels[i][1]
+		# Only the closest alert on each side can be within 0.1% of the requested level
+		for existing, levelText in levels[max(i - 1, 0):i + 1]:
+			if existing * 0.999 < level < existing * 1.001:
+				return "near", levelText
+		return None, None
+
+	def __len__(self):
+		return len(self.alerts)
+
+
+class AlertIndex(object):
+	def __init__(self, maxsize=2000, ttl=300.0):
+		# Alerts triggered by the alert service or changed on the website are picked up once an entry expires
+		self.owners = LoadingCache(self.load, maxsize=maxsize, ttl=ttl)
+		self.database = None
+
+	def start(self, database):
+		self.database = database
+
+	async def get(self, ownerId):
+		return await self.owners.get(str(ownerId))
+
+	async def reload(self, ownerId):
+		self.owners.invalidate(str(ownerId))
+		return await self.get(ownerId)
+
+	@staticmethod
+	def find(owners, tickerId, level):
+		for owner in owners:
+			match, levelText = owner.find(tickerId, level)
+			if match is not None: return match, levelText
+		return None, None
+
+	async def load(self, ownerId):
+		owner = OwnerAlerts()
+		for alert in await self.database.collection(f"details/marketAlerts/{ownerId}").get():
+			owner.add(alert.id, alert.to_dict())
+		return owner
+
+	def add(self, ownerId, alertId, alert):
+		owner = self.owners.cached(str(ownerId))
+		if owner is not None: owner.add(alertId, alert)
+
+	def remove(self, ownerId, alertId):
+		owner = self.owners.cached(str(ownerId))
+		if owner is not None: owner.remove(alertId)
+
+
+alertIndex = AlertIndex()
@@ -0,0 +1,63 @@
+from threading import BoundedSemaphore
+from types import MappingProxyType
+from traceback import format_exc
+
+
+class SnapshotBridge(object):
+	def __init__(self, loop, maxsize=1000):
+		self.loop = loop
+		self.slots = BoundedSemaphore(maxsize)
+
+	def wrap(self, callback):
+		def on_snapshot(documents, changes, timestamp):
+			# Blocks the watch thread instead of piling up callbacks when the event loop falls behind
+			self.slots.acquire()
+			try: self.loop.call_soon_threadsafe(self.dispatch, callback, documents, changes, timestamp)
+			except:
+				self.slots.release()
+				raise
+		return on_snapshot
+
+	def listen(self, reference, callback):
+		# All listeners are registered here, so that no callback ever runs on the watch thread
+		return reference.on_snapshot(self.wrap(callback))
+
+	def dispatch(self, callback, documents, changes, timestamp):
+		try: callback(documents, changes, timestamp)
+		except: print(format_exc())
+		finally: self.slots.release()
+
+
+def freeze(value):
+	if isinstance(value, dict):
+		return MappingProxyType({key: freeze(item) for key, item in value.items()})
+	elif isinstance(value, list):
+		return tuple(freeze(item) for item in value)
+	return value
+
+def thaw(value):
+	if isinstance(value, MappingProxyType):
+		return {key: thaw(item) for key, item in value.items()}
+	elif isinstance(value, tuple):
+		return [thaw(item) for item in value]
+	return value
+
+
+class VersionedSnapshot(object):
+	__slots__ = ("data", "version")
+
+	def __init__(self, data, version=0):
+		self.data = freeze(data)
+		self.version = version
+
+	def __getitem__(self, key):
+		return self.data[key]
+
+	def __contains__(self, key):
+		return key in self.data
+
+	def get(self, key, default=None):
+		return self.data.get(key, default)
+
+	def to_dict(self):
+		return thaw(self.data)
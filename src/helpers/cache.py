@@ -0,0 +1,149 @@
+from time import time
+from copy import deepcopy
+from threading import Lock
+from collections import OrderedDict
+from asyncio import shield, create_task
+
+
+MISSING = object()
+
+
+class TTLCache(object):
+	def __init__(self, maxsize=10000, ttl=60.0, negativeTtl=None):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.negativeTtl = ttl if negativeTtl is None else negativeTtl
+		self.hits = 0
+		self.misses = 0
+		self._data = OrderedDict()
+		self._lock = Lock()
+
+	def get(self, key, default=MISSING):
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None:
+				self.misses += 1
+				return default
+			value, expiry = entry
+			if expiry < time():
+				del self._data[key]
+				self.misses += 1
+				return default
+			self._data.move_to_end(key)
+			self.hits += 1
+			return value
+
+	def set(self, key, value, ttl=None):
+		if ttl is None:
+			ttl = self.negativeTtl if value is None else self.ttl
+		with self._lock:
+			self._data[key] = (value, time() + ttl)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def pop(self, key):
+		with self._lock:
+			entry = self._data.pop(key, None)
+		return MISSING if entry is None else entry[0]
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def __contains__(self, key):
+		return self.get(key) is not MISSING
+
+	def __len__(self):
+		return len(self._data)
+
+
+class LoadingCache(object):
+	def __init__(self, load, maxsize=5000, ttl=300.0):
+		self.load = load
+		self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+		self.inflight = {}
+		self.stale = set()
+
+	async def get(self, key):
+		entry = self.entries.get(key)
+		if entry is not MISSING: return entry
+
+		# Concurrent misses for the same key share a single read
+		request = self.inflight.get(key)
+		if request is None:
+			request = create_task(self.fetch(key))
+			self.inflight[key] = request
+			request.add_done_callback(lambda _: self.inflight.pop(key, None))
+		return await shield(request)
+
+	async def fetch(self, key):
+		try: entry = await self.load(key)
+		except:
+			self.stale.discard(key)
+			raise
+		# A read that overlapped with a local write may or may not include it, so it's only used once
+		if key in self.stale: self.stale.discard(key)
+		else: self.entries.set(key, entry)
+		return entry
+
+	def cached(self, key):
+		# Local writes are applied to cached entries only, anything else is loaded fresh on the next read
+		if key in self.inflight: self.stale.add(key)
+		entry = self.entries.get(key)
+		return None if entry is MISSING else entry
+
+	def invalidate(self, key):
+		if key in self.inflight: self.stale.add(key)
+		self.entries.pop(key)
+
+	def __len__(self):
+		return len(self.entries)
+
+
+class AccountCache(object):
+	def __init__(self, connector=None, maxsize=50000, ttl=60.0, negativeTtl=60.0):
+		self.connector = connector
+		# Changes made on the website, including users who link or unlink their Discord account, are picked up once an
+		# entry expires. Changes made by the bot invalidate the affected keys right away.
+		# Discord user id -> account id, None when the user has no Alpha.bot account
+		self.accounts = TTLCache(maxsize=maxsize, ttl=ttl, negativeTtl=negativeTtl)
+		# Account id (or Discord user id for unregistered users) -> properties, None when not found
+		self.properties = TTLCache(maxsize=maxsize, ttl=ttl, negativeTtl=negativeTtl)
+		# Account id -> Discord user id of the cached match
+		self.links = TTLCache(maxsize=maxsize, ttl=ttl)
+
+	def start(self, connector):
+		self.connector = connector
+
+	async def match(self, authorId):
+		authorId = str(authorId)
+		accountId = self.accounts.get(authorId)
+		if accountId is MISSING:
+			accountId = await self.connector.match(int(authorId))
+			self.accounts.set(authorId, accountId)
+			if accountId is not None: self.links.set(str(accountId), authorId)
+		return accountId
+
+	async def get(self, key, default=None):
+		key = str(key)
+		properties = self.properties.get(key)
+		if properties is MISSING:
+			properties = await self.connector.get(key)
+			self.properties.set(key, properties)
+		# Commands mutate the returned properties in place, so cached entries are never handed out directly
+		return default if properties is None else deepcopy(properties)
+
+	def invalidate(self, *keys):
+		for key in keys:
+			if key is None: continue
+			key = str(key)
+			self.properties.pop(key)
+			# Properties of registered users are also cached under their Discord user id, which is matched again
+			authorId = self.links.pop(key)
+			if authorId is not MISSING:
+				self.accounts.pop(authorId)
+				self.properties.pop(authorId)
+
+
+accountProperties = AccountCache()
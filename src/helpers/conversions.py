@@ -0,0 +1,136 @@
+from collections import Counter
+from asyncio import sleep, shield, create_task, CancelledError
+from traceback import format_exc
+
+from helpers.cache import TTLCache, MISSING
+from helpers.rates import RateGraph
+from Processor import process_conversion
+
+
+def format_amount(amount):
+	return "{:,.8f}".format(amount).rstrip('0').rstrip('.')
+
+
+class ConversionCache(object):
+	def __init__(self, maxsize=10000, ttl=30.0, negativeTtl=10.0, platformTtl=None, refreshInterval=30.0, refreshCount=50):
+		self.ttl = ttl
+		self.negativeTtl = negativeTtl
+		# Crypto exchanges move faster than the aggregated sources, so their rates go stale sooner
+		self.platformTtl = {"CCXT": 10.0, "Twelvedata": 30.0, "CoinGecko": 60.0} if platformTtl is None else platformTtl
+		# (from, to, platforms, acceptable quotes) -> (unit rate, metadata, response message)
+		self.rates = TTLCache(maxsize=maxsize, ttl=ttl)
+		self.inflight = {}
+		self.graph = RateGraph()
+		self.refreshInterval = refreshInterval
+		self.refreshCount = refreshCount
+		self.requests = Counter()
+		# Arguments of the latest conversion for each key, so that popular rates can be refreshed in the background
+		self.recent = TTLCache(maxsize=1000, ttl=600.0)
+		self.task = None
+		self.hits = 0
+		self.misses = 0
+		self.coalesced = 0
+		self.local = 0
+
+	def start(self):
+		if self.task is None:
+			self.task = create_task(self.run())
+
+	def freshness(self, platforms):
+		return min([self.platformTtl.get(platform, self.ttl) for platform in platforms] or [self.ttl])
+
+	async def convert(self, request, base, quote, amount, platforms, acceptable=None):
+		if amount == 0:
+			return await process_conversion(request, base, quote, amount, platforms, acceptable=acceptable)
+
+		key = (base, quote, tuple(platforms), None if acceptable is None else tuple(acceptable))
+		self.remember(key, request)
+		entry = self.rates.get(key)
+		if entry is not MISSING:
+			self.hits += 1
+			return self.format(entry, base, quote, amount)
+
+		# Pairs that weren't requested recently can often be chained from fresh rates of other pairs
+		resolved = self.graph.resolve(base, quote, platforms)
+		if resolved is not None:
+			self.local += 1
+			rate, path = resolved
+			for hop in zip(path, path[1:]):
+				self.remember((*hop, *key[2:]), request)
+			return self.format((rate, {"messageColor": "deep purple", "path": tuple(path)}, None), base, quote, amount)
+
+		# Concurrent misses for the same pair share a single upstream request
+		fetch = self.inflight.get(key)
+		if fetch is None:
+			self.misses += 1
+			fetch = create_task(self.fetch(key, request, base, quote, amount, platforms, acceptable))
+			self.inflight[key] = fetch
+			fetch.add_done_callback(lambda _: self.inflight.pop(key, None))
+			return self.format(await shield(fetch), base, quote, amount)
+
+		self.coalesced += 1
+		return self.format(await shield(fetch), base, quote, amount)
+
+	async def fetch(self, key, request, base, quote, amount, platforms, acceptable):
+		payload, responseMessage = await process_conversion(request, base, quote, amount, platforms, acceptable=acceptable)
+		if payload is None:
+			self.rates.set(key, (None, None, responseMessage), ttl=self.negativeTtl)
+			return None, None, responseMessage
+
+		# Only the unit rate and fields that don't depend on the amount are kept, so any amount can be answered from the
+		# same entry exactly like the request that filled it
+		rate = payload["raw"]["quotePrice"][0] / amount
+		entry = (rate, {"messageColor": payload.get("messageColor", "deep purple"), "platform": payload.get("platform")}, responseMessage)
+		self.rates.set(key, entry, ttl=self.freshness(platforms))
+		self.graph.observe(payload.get("platform"), base, quote, rate, maxAge=self.freshness([payload.get("platform")]))
+		return entry
+
+	def observe_quote(self, ticker, payload):
+		self.graph.observe_quote(ticker, payload, maxAge=self.freshness([payload.get("platform")]))
+
+	def remember(self, key, request):
+		self.requests[key] += 1
+		self.recent.set(key, request)
+
+	def format(self, entry, base, quote, amount):
+		rate, metadata, responseMessage = entry
+		if rate is None: return None, responseMessage
+
+		converted = amount * rate
+		return {
+			**metadata,
+			"quotePrice": f"{format_amount(amount)} {base}",
+			"quoteConvertedPrice": f"{format_amount(converted)} {quote}",
+			"raw": {"quotePrice": [converted]}
+		}, responseMessage
+
+	async def run(self):
+		try:
+			while True:
+				await sleep(self.refreshInterval)
+				await self.refresh()
+		except CancelledError: pass
+
+	async def refresh(self):
+		# Keeps the most used rates, including the hops of locally resolved paths, fresh in the graph
+		popular = self.requests.most_common(self.refreshCount)
+		self.requests = Counter()
+		for key, _ in popular:
+			request = self.recent.get(key)
+			if request is MISSING or key in self.rates or key in self.inflight: continue
+			base, quote, platforms, acceptable = key
+			try: await self.fetch(key, request, base, quote, 1, list(platforms), None if acceptable is None else list(acceptable))
+			except: print(format_exc())
+		self.graph.prune()
+
+	async def close(self):
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+
+	def stats(self):
+		total = self.hits + self.misses + self.coalesced + self.local
+		return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "local": self.local, "hitRate": 0 if total == 0 else (self.hits + self.coalesced + self.local) / total, "size": len(self.rates)}
+
+
+conversions = ConversionCache()
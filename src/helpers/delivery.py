@@ -0,0 +1,121 @@
+from collections import deque, OrderedDict
+from asyncio import Queue, Event, wait_for, create_task, get_running_loop, CancelledError
+from traceback import format_exc
+
+from helpers.cache import TTLCache
+
+
+class DeliveryQueue(object):
+	def __init__(self, deliver, database, path="discord/properties/messages", workers=16, maxPending=10000, retries=3, backoff=2.0, deleteInterval=1.0):
+		self.deliver = deliver
+		self.database = database
+		self.path = path
+		self.workers = workers
+		self.maxPending = maxPending
+		self.retries = retries
+		self.backoff = backoff
+		self.deleteInterval = deleteInterval
+
+		# Messages are queued per destination, so each channel or DM only ever has one send in flight
+		self.lanes = {}
+		self.ready = Queue()
+		self.pending = 0
+		# Messages that arrived while the queue was full, in arrival order
+		self.backlog = OrderedDict()
+		self.overflowed = 0
+		# Message document ids that are queued, held back, or were already delivered
+		self.seen = TTLCache(maxsize=100000, ttl=3600.0)
+		self.deletions = []
+		self.deletionsReady = Event()
+		self.tasks = []
+
+	def submit(self, messageId, message):
+		if messageId in self.seen: return
+		self.seen.set(messageId, True)
+		if self.pending >= self.maxPending:
+			# No later snapshot event delivers the message again, so it's held back instead of being dropped
+			self.backlog[messageId] = message
+			self.overflowed += 1
+			return
+		self.pending += 1
+		self.enqueue(messageId, message, 0)
+
+	def release(self):
+		self.pending -= 1
+		while self.pending < self.maxPending and len(self.backlog) != 0:
+			messageId, message = self.backlog.popitem(last=False)
+			self.pending += 1
+			self.enqueue(messageId, message, 0)
+
+	def enqueue(self, messageId, message, attempt):
+		destination = f"user:{message['user']}" if message.get("user") is not None else f"channel:{message.get('channel')}"
+		lane = self.lanes.get(destination)
+		if lane is None:
+			self.lanes[destination] = deque([(messageId, message, attempt)])
+			self.ready.put_nowait(destination)
+		else:
+			lane.append((messageId, message, attempt))
+
+	def start(self):
+		if len(self.tasks) != 0: return
+		self.tasks = [create_task(self.work()) for _ in range(self.workers)]
+		self.tasks.append(create_task(self.run_deletions()))
+
+	async def work(self):
+		try:
+			while True:
+				destination = await self.ready.get()
+				lane = self.lanes[destination]
+				messageId, message, attempt = lane.popleft()
+
+				try: delivered = await self.deliver(messageId, message)
+				except:
+					print(format_exc())
+					delivered = False
+
+				if delivered:
+					self.release()
+					self.deletions.append(messageId)
+					if len(self.deletions) >= 500: self.deletionsReady.set()
+				elif attempt < self.retries:
+					get_running_loop().call_later(self.backoff * 2 ** attempt, self.enqueue, messageId, message, attempt + 1)
+				else:
+					# The message stays in the database, so a later change to it can be retried
+					self.seen.pop(messageId)
+					self.release()
+
+				if len(lane) != 0:
+					self.ready.put_nowait(destination)
+				else:
+					self.lanes.pop(destination)
+		except CancelledError: pass
+
+	def stats(self):
+		return {"pending": self.pending, "backlog": len(self.backlog), "overflowed": self.overflowed}
+
+	async def run_deletions(self):
+		try:
+			while True:
+				try: await wait_for(self.deletionsReady.wait(), timeout=self.deleteInterval)
+				except TimeoutError: pass
+				self.deletionsReady.clear()
+				await self.flush_deletions()
+		except CancelledError: pass
+
+	async def flush_deletions(self):
+		while len(self.deletions) != 0:
+			messageIds, self.deletions = self.deletions[:500], self.deletions[500:]
+			batch = self.database.batch()
+			for messageId in messageIds:
+				batch.delete(self.database.document(f"{self.path}/{messageId}"))
+			try: await batch.commit()
+			except:
+				print(format_exc())
+				self.deletions.extend(messageIds)
+				return
+
+	async def close(self):
+		for task in self.tasks:
+			task.cancel()
+		self.tasks = []
+		await self.flush_deletions()
@@ -0,0 +1,146 @@
+from time import time, monotonic
+from copy import deepcopy
+from asyncio import Semaphore, gather, sleep, create_task
+from traceback import format_exc
+from discord.errors import NotFound, Forbidden
+
+from helpers.cache import TTLCache, MISSING
+
+
+# Top level fields of guild properties that commands read, everything else stays in the database
+FIELDS = ("addons", "charting", "connection", "settings")
+
+
+class GuildRecord(object):
+	__slots__ = FIELDS + ("exists", "expiry")
+
+	def __init__(self, properties, expiry):
+		self.exists = properties is not None
+		self.expiry = expiry
+		for field in FIELDS:
+			setattr(self, field, None if properties is None else properties.get(field))
+
+	def to_dict(self):
+		if not self.exists: return None
+		# Commands mutate the returned properties in place, so fields are never handed out directly
+		return {field: deepcopy(getattr(self, field)) for field in FIELDS if getattr(self, field) is not None}
+
+
+class GuildMirror(object):
+	def __init__(self, path="discord/properties/guilds", ttl=60.0, batchSize=300):
+		self.path = path
+		self.ttl = ttl
+		self.batchSize = batchSize
+		self.records = {}
+		self.refreshing = set()
+		self.database = None
+		self.task = None
+		self.ready = False
+
+	def is_ready(self):
+		return self.ready
+
+	def get(self, guildId, default=None):
+		guildId = int(guildId)
+		record = self.records.get(guildId)
+		if record is None or record.expiry < time():
+			# Stale and unknown guilds are served from memory while they are read again in the background
+			self.refresh_later(guildId)
+		properties = None if record is None else record.to_dict()
+		return default if properties is None else properties
+
+	def update(self, guildId, properties):
+		self.records[int(guildId)] = GuildRecord(properties, time() + self.ttl)
+
+	def drop(self, guildId):
+		self.records.pop(int(guildId), None)
+
+	def invalidate(self, guildId):
+		# Changes made elsewhere are read again right away instead of waiting for the record to expire
+		guildId = int(guildId)
+		record = self.records.get(guildId)
+		if record is not None: record.expiry = 0
+		self.refresh_later(guildId)
+
+	def process_invalidations(self, documents, changes, timestamp):
+		# The dashboard marks a guild as changed by writing a document named after it
+		for change in changes:
+			if change.type.name in ["ADDED", "MODIFIED"]:
+				self.invalidate(change.document.id)
+
+	def start(self, database, guildIds):
+		self.database = database
+		if self.task is None:
+			self.task = create_task(self.load(list(guildIds)))
+
+	async def load(self, guildIds):
+		# Only guilds served by this process are read, in batches and limited to the fields commands use
+		for i in range(0, len(guildIds), self.batchSize):
+			try: await self.load_many(guildIds[i:i + self.batchSize])
+			except: print(format_exc())
+		self.ready = True
+		await self.refresh()
+
+	async def load_many(self, guildIds):
+		references = [self.database.document(f"{self.path}/{guildId}") for guildId in guildIds]
+		async for document in self.database.get_all(references, field_paths=list(FIELDS)):
+			self.update(document.id, document.to_dict() if document.exists else None)
+
+	def refresh_later(self, guildId):
+		if guildId in self.refreshing: return
+		self.refreshing.add(guildId)
+		if self.ready and (self.task is None or self.task.done()):
+			self.task = create_task(self.refresh())
+
+	async def refresh(self):
+		# Guilds that need to be read again while a batch is in flight are picked up by the next one
+		while len(self.refreshing) != 0:
+			guildIds = list(self.refreshing)[:self.batchSize]
+			try: await self.load_many(guildIds)
+			except: print(format_exc())
+			finally: self.refreshing.difference_update(guildIds)
+
+
+class GuildMetadataFetcher(object):
+	def __init__(self, bot, ttl=86400.0, concurrency=4, rate=5.0):
+		self.bot = bot
+		self.cache = TTLCache(maxsize=5000, ttl=ttl)
+		self.concurrency = Semaphore(concurrency)
+		self.interval = 1.0 / rate
+		self.nextRequest = 0
+
+	async def get(self, guildId):
+		guildId = int(guildId)
+
+		# Guilds served by this process are already in the gateway cache
+		guild = self.bot.get_guild(guildId)
+		if guild is not None:
+			return {"url": None if guild.icon is None else guild.icon.url, "name": guild.name, "members": guild.member_count}
+
+		metadata = self.cache.get(guildId)
+		if metadata is not MISSING: return metadata
+
+		async with self.concurrency:
+			await self.pace()
+			try:
+				guild = await self.bot.fetch_guild(guildId, with_counts=True)
+			except (NotFound, Forbidden):
+				metadata = None
+			except:
+				print(format_exc())
+				return None
+			else:
+				metadata = {"url": None if guild.icon is None else guild.icon.url, "name": guild.name, "members": guild.approximate_member_count}
+
+		self.cache.set(guildId, metadata)
+		return metadata
+
+	async def pace(self):
+		# Spreads requests out so that the refresh never takes a large share of the global rate limit
+		now = monotonic()
+		delay = self.nextRequest - now
+		self.nextRequest = max(now, self.nextRequest) + self.interval
+		if delay > 0: await sleep(delay)
+
+	async def get_many(self, guildIds):
+		return await gather(*[self.get(guildId) for guildId in guildIds])
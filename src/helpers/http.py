@@ -0,0 +1,63 @@
+from os import environ
+from math import ceil
+from asyncio import sleep, gather
+from orjson import loads
+from aiohttp import ClientSession, TCPConnector, ClientTimeout, ClientError
+
+
+class HttpClient(object):
+	def __init__(self, limit=100, limitPerHost=20, keepalive=60.0, timeout=10.0, retries=2, backoff=0.5):
+		self.limit = limit
+		self.limitPerHost = limitPerHost
+		self.keepalive = keepalive
+		self.timeout = ClientTimeout(total=timeout)
+		self.retries = retries
+		self.backoff = backoff
+		self._session = None
+
+	@property
+	def session(self):
+		# Created lazily, so that the session is bound to the running event loop
+		if self._session is None or self._session.closed:
+			connector = TCPConnector(limit=self.limit, limit_per_host=self.limitPerHost, keepalive_timeout=self.keepalive, ttl_dns_cache=300)
+			self._session = ClientSession(connector=connector, timeout=self.timeout)
+		return self._session
+
+	async def request(self, method, url, retries=None, **kwargs):
+		retries = self.retries if retries is None else retries
+		for attempt in range(retries + 1):
+			try:
+				async with self.session.request(method, url, **kwargs) as response:
+					if response.status == 429 or response.status >= 500:
+						if attempt < retries:
+							await sleep(self.backoff * 2 ** attempt)
+							continue
+					body = await response.read()
+					return response.status, body
+			except (ClientError, TimeoutError):
+				if attempt == retries: raise
+				await sleep(self.backoff * 2 ** attempt)
+
+	async def get_json(self, url, **kwargs):
+		_, body = await self.request("GET", url, **kwargs)
+		return loads(body)
+
+	async def post(self, url, **kwargs):
+		status, _ = await self.request("POST", url, **kwargs)
+		return status
+
+	async def close(self):
+		if self._session is not None and not self._session.closed:
+			await self._session.close()
+		self._session = None
+
+
+http = HttpClient()
+
+
+async def get_coins_markets(count, perPage=250):
+	# Top coins by market cap with their 24h change, only the pages needed for the requested count are fetched at once
+	url = "https://pro-api.coingecko.com/api/v3/coins/markets"
+	parameters = {"vs_currency": "usd", "order": "market_cap_desc", "per_page": perPage, "price_change_percentage": "24h", "x_cg_pro_api_key": environ["COINGECKO_API_KEY"]}
+	pages = await gather(*[http.get_json(url, params={**parameters, "page": page}) for page in range(1, ceil(count / perPage) + 1)])
+	return [coin for page in pages for coin in page][:count]
@@ -0,0 +1,111 @@
+from time import time
+from uuid import uuid4
+from asyncio import Semaphore, gather, create_task, CancelledError
+from traceback import format_exc
+
+from google.cloud.firestore import Query
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+
+class BulkDeleter(object):
+	def __init__(self, path="discord/properties/jobs", batchSize=400, maxInFlight=2, checkpointInterval=5.0):
+		self.path = path
+		self.batchSize = batchSize
+		self.maxInFlight = maxInFlight
+		self.checkpointInterval = checkpointInterval
+		self.tasks = {}
+		self.database = None
+		self.botId = None
+
+	def start(self, database, botId):
+		self.database = database
+		self.botId = botId
+		create_task(self.resume())
+
+	async def resume(self):
+		# Jobs interrupted by a restart continue from their last checkpoint, without anyone to report progress to
+		try:
+			for job in await self.database.collection(self.path).where(filter=FieldFilter("botId", "==", self.botId)).get():
+				if job.id not in self.tasks:
+					self.launch(job.id, job.to_dict())
+		except:
+			print(format_exc())
+
+	async def submit(self, collections, cutoff, progress=None):
+		jobId = str(uuid4())
+		job = {"collections": collections, "cutoff": cutoff, "position": 0, "deleted": 0, "timestamp": time(), "botId": self.botId}
+		await self.database.document(f"{self.path}/{jobId}").set(job)
+		self.launch(jobId, job, progress)
+		return jobId
+
+	def launch(self, jobId, job, progress=None):
+		task = create_task(self.run(jobId, job, progress))
+		self.tasks[jobId] = task
+		task.add_done_callback(lambda _: self.tasks.pop(jobId, None))
+
+	async def run(self, jobId, job, progress):
+		inFlight = Semaphore(self.maxInFlight)
+		pending = []
+		deleted = job.get("deleted", 0)
+		checkpoint = time()
+
+		async def commit(batch, count):
+			nonlocal deleted
+			try:
+				await batch.commit()
+				deleted += count
+			finally:
+				inFlight.release()
+
+		try:
+			for position in range(job.get("position", 0), len(job["collections"])):
+				# Only documents that existed when the job was submitted are removed, so anything written since survives
+				query = self.database.collection(job["collections"][position]).where(filter=FieldFilter("timestamp", "<=", job["cutoff"])).order_by("timestamp", direction=Query.ASCENDING).select(["timestamp"]).limit(self.batchSize)
+				cursor = None
+				while True:
+					documents = await (query if cursor is None else query.start_after(cursor)).get()
+					if len(documents) == 0: break
+					cursor = documents[-1]
+
+					# The next page is read while earlier batches are still being committed, with a bounded number in flight
+					await inFlight.acquire()
+					self.settle(pending)
+					batch = self.database.batch()
+					for document in documents:
+						batch.delete(document.reference)
+					pending.append(create_task(commit(batch, len(documents))))
+
+					if time() - checkpoint >= self.checkpointInterval:
+						self.settle(pending)
+						checkpoint = time()
+						await self.database.document(f"{self.path}/{jobId}").set({"position": position, "deleted": deleted}, merge=True)
+						if progress is not None: await self.report(progress, deleted, False)
+
+					if len(documents) < self.batchSize: break
+
+				await gather(*pending)
+				pending.clear()
+
+			await self.database.document(f"{self.path}/{jobId}").delete()
+			if progress is not None: await self.report(progress, deleted, True)
+
+		except CancelledError: pass
+		except:
+			# The job document is left in place, so the job resumes after the next restart. Checkpoints never move past a
+			# collection with a failed batch, and its remaining documents still match the query when it's read again.
+			print(format_exc())
+			await gather(*pending, return_exceptions=True)
+
+	@staticmethod
+	def settle(pending):
+		# Commits are only dropped once their outcome was checked, so a failed batch always stops the job
+		for task in [e for e in pending if e.done()]:
+			pending.remove(task)
+			task.result()
+
+	async def report(self, progress, deleted, finished):
+		try: await progress(deleted, finished)
+		except: print(format_exc())
+
+
+bulkDeleter = BulkDeleter()
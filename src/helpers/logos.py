@@ -0,0 +1,123 @@
+from os import environ
+from time import time
+from collections import Counter
+from asyncio import sleep, create_task, CancelledError
+from urllib.parse import quote
+from traceback import format_exc
+
+from helpers.cache import TTLCache, MISSING
+from helpers.http import http
+
+
+class LogoCache(object):
+	def __init__(self, path="discord/properties/logos", ttl=30 * 86400.0, memoryTtl=6 * 3600.0, failureTtl=300.0, maxsize=5000, prewarmInterval=3600.0, prewarmCount=200):
+		self.path = path
+		self.ttl = ttl
+		self.failureTtl = failureTtl
+		self.memory = TTLCache(maxsize=maxsize, ttl=memoryTtl)
+		self.prewarmInterval = prewarmInterval
+		self.prewarmCount = prewarmCount
+		self.requests = Counter()
+		self.refreshing = set()
+		self.database = None
+		self.task = None
+
+	@staticmethod
+	def key(ticker):
+		exchange = ticker.get("exchange", {})
+		exchangeName = exchange.get("name") if exchange.get("id") is not None and exchange.get("id") != "forex" else None
+		return (ticker.get("symbol"), exchangeName, ticker["metadata"]["type"])
+
+	@staticmethod
+	def document_id(key):
+		symbol, exchangeName, assetType = key
+		return "|".join([symbol, exchangeName or "", assetType]).replace("/", "_")
+
+	def start(self, database):
+		self.database = database
+		if self.task is None:
+			self.task = create_task(self.run())
+
+	async def get(self, ticker):
+		key = self.key(ticker)
+		self.requests[key] += 1
+
+		url = self.memory.get(key)
+		if url is not MISSING: return url
+
+		if self.database is not None:
+			entry = await self.database.document(f"{self.path}/{self.document_id(key)}").get()
+			# Entries without a url were left behind by failed lookups and are fetched again
+			if entry.exists and entry.to_dict().get("url") is not None:
+				entry = entry.to_dict()
+				self.memory.set(key, entry.get("url"))
+				if entry.get("timestamp", 0) + self.ttl < time():
+					# Expired logos are still served while a fresh one is fetched in the background
+					self.refresh_later(key)
+				return entry.get("url")
+
+		return await self.refresh(key)
+
+	def refresh_later(self, key):
+		if key in self.refreshing: return
+		self.refreshing.add(key)
+		task = create_task(self.refresh(key))
+		task.add_done_callback(lambda _: self.refreshing.discard(key))
+
+	async def refresh(self, key):
+		symbol, exchangeName, assetType = key
+		url = f"https://api.twelvedata.com/logo?apikey={environ['TWELVEDATA_KEY']}&interval=1min&type={quote(assetType)}&format=JSON&symbol={symbol}"
+		if exchangeName is not None:
+			url += f"&exchange={exchangeName}"
+
+		try:
+			response = await http.get_json(url)
+		except:
+			print(format_exc())
+			response = {}
+
+		# Twelvedata reports errors, including rate limits, in the response body. Those are only remembered
+		# briefly, so that a failed lookup never hides a logo for long.
+		if "url" not in response:
+			# An expired logo that failed to refresh is still better than none
+			if key not in self.memory: self.memory.set(key, None, ttl=self.failureTtl)
+			return None
+
+		thumbnailUrl = response["url"]
+		self.memory.set(key, thumbnailUrl)
+		if self.database is not None:
+			try: await self.database.document(f"{self.path}/{self.document_id(key)}").set({"url": thumbnailUrl, "timestamp": time()})
+			except: print(format_exc())
+		return thumbnailUrl
+
+	async def run(self):
+		try:
+			while True:
+				await sleep(self.prewarmInterval)
+				await self.prewarm()
+		except CancelledError: pass
+
+	async def prewarm(self):
+		# Keeps the most requested logos resident, so commands never wait on a logo lookup for them
+		popular = self.requests.most_common(self.prewarmCount)
+		self.requests = Counter(dict(popular))
+		for key, _ in popular:
+			if key in self.memory: continue
+			try: await self.get_by_key(key)
+			except: print(format_exc())
+
+	async def get_by_key(self, key):
+		if self.database is not None:
+			entry = await self.database.document(f"{self.path}/{self.document_id(key)}").get()
+			if entry.exists and entry.to_dict().get("url") is not None and entry.to_dict().get("timestamp", 0) + self.ttl >= time():
+				self.memory.set(key, entry.to_dict().get("url"))
+				return
+		await self.refresh(key)
+
+	async def close(self):
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+
+
+logos = LogoCache()
@@ -0,0 +1,118 @@
+from time import time
+from asyncio import gather
+
+from google.cloud.firestore import Increment
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from helpers.cache import LoadingCache
+
+
+class OwnerQuotas(object):
+	__slots__ = ("counts",)
+
+	def __init__(self):
+		# Collection name -> (count, timestamp of the last full recount)
+		self.counts = {}
+
+	def update(self, properties):
+		for collection, entry in properties.items():
+			if not isinstance(entry, dict): continue
+			self.counts[collection] = (max(entry.get("count", 0), 0), entry.get("timestamp", 0))
+
+	def adjust(self, collection, change):
+		count, timestamp = self.counts.get(collection, (0, 0))
+		self.counts[collection] = (max(count + change, 0), timestamp)
+
+
+class QuotaCounters(object):
+	# Counters are only kept up to date by the bot. Alerts and scheduled posts created or removed on the website are
+	# picked up by a full recount once a counter is older than the cache lifetime, so counts are never more than a few
+	# minutes behind. Counters that read high are also corrected by exceeds() before refusing.
+	def __init__(self, path="discord/properties/quotas", maxsize=5000, ttl=300.0, recountInterval=None):
+		self.path = path
+		self.recountInterval = ttl if recountInterval is None else recountInterval
+		self.owners = LoadingCache(self.load, maxsize=maxsize, ttl=ttl)
+		self.database = None
+
+	def start(self, database):
+		self.database = database
+
+	async def get(self, ownerId):
+		return await self.owners.get(str(ownerId))
+
+	async def load(self, ownerId):
+		owner = OwnerQuotas()
+		counters = await self.database.document(f"{self.path}/{ownerId}").get()
+		owner.update(counters.to_dict() or {})
+		return owner
+
+	async def count(self, collection, ownerId):
+		owner = await self.get(ownerId)
+		count, timestamp = owner.counts.get(collection, (None, 0))
+		# Counters are seeded from a full count the first time they're used, and recounted whenever they're older than
+		# the cache lifetime to pick up alerts and posts that were created or removed outside of the bot
+		if count is None or timestamp + self.recountInterval < time():
+			count = await self.recount(collection, ownerId)
+		return count
+
+	async def total(self, collection, ownerIds):
+		return sum(await gather(*[self.count(collection, ownerId) for ownerId in ownerIds]))
+
+	async def exceeds(self, collection, ownerIds, limit, requested=1):
+		if await self.total(collection, ownerIds) + requested <= limit: return False
+		# Counters only drift upwards when documents are removed elsewhere, so a full count is only needed before refusing
+		counts = await gather(*[self.recount(collection, ownerId) for ownerId in ownerIds])
+		return sum(counts) + requested > limit
+
+	async def recount(self, collection, ownerId):
+		ownerId = str(ownerId)
+		response = await self.database.collection(f"details/{collection}/{ownerId}").count().get()
+		count = response[0][0].value
+		await self.database.document(f"{self.path}/{ownerId}").set({collection: {"count": count, "timestamp": time()}}, merge=True)
+		owner = self.owners.cached(ownerId)
+		if owner is not None: owner.counts[collection] = (count, time())
+		return count
+
+	async def add(self, collection, ownerId, documentId, properties):
+		await self.add_many(collection, ownerId, {documentId: properties})
+
+	async def add_many(self, collection, ownerId, documents):
+		# All documents and the counter update are committed at once, so either every document is created or none is
+		ownerId = str(ownerId)
+		batch = self.database.batch()
+		for documentId, properties in documents.items():
+			batch.set(self.database.document(f"details/{collection}/{ownerId}/{documentId}"), properties)
+		batch.set(self.database.document(f"{self.path}/{ownerId}"), {collection: {"count": Increment(len(documents))}}, merge=True)
+		await batch.commit()
+		self.adjust(collection, ownerId, len(documents))
+
+	async def remove(self, collection, ownerId, documentId):
+		await self.remove_many(collection, ownerId, [documentId])
+
+	async def remove_many(self, collection, ownerId, documentIds):
+		ownerId = str(ownerId)
+		batch = self.database.batch()
+		for documentId in documentIds:
+			batch.delete(self.database.document(f"details/{collection}/{ownerId}/{documentId}"))
+		batch.set(self.database.document(f"{self.path}/{ownerId}"), {collection: {"count": Increment(-len(documentIds))}}, merge=True)
+		await batch.commit()
+		self.adjust(collection, ownerId, -len(documentIds))
+
+	async def clear(self, collection, ownerId):
+		# Collections with a quota are small, so all documents and the counter are removed in a single batch
+		ownerId = str(ownerId)
+		batch = self.database.batch()
+		for document in await self.database.collection(f"details/{collection}/{ownerId}").select([FieldPath.document_id()]).get():
+			batch.delete(document.reference)
+		batch.set(self.database.document(f"{self.path}/{ownerId}"), {collection: {"count": 0, "timestamp": time()}}, merge=True)
+		await batch.commit()
+		owner = self.owners.cached(ownerId)
+		if owner is not None: owner.counts[collection] = (0, time())
+
+	def adjust(self, collection, ownerId, change):
+		# Counters changed by this process are updated in place instead of being read again
+		owner = self.owners.cached(ownerId)
+		if owner is not None: owner.adjust(collection, change)
+
+
+quotas = QuotaCounters()
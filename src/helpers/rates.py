@@ -0,0 +1,71 @@
+from time import time
+
+
+# Platforms that quote tradable markets. Others, like the fear and greed indices, report values that aren't prices.
+MARKET_PLATFORMS = ["CCXT", "CoinGecko", "Twelvedata"]
+
+
+class RateGraph(object):
+	def __init__(self, maxAge=60.0, maxHops=3):
+		self.maxAge = maxAge
+		self.maxHops = maxHops
+		# Platform -> asset -> {asset: (rate, expiry)}. Platforms are kept apart, so that a conversion limited to one
+		# platform is never answered with another platform's rates, and equal symbols of different asset types never meet.
+		self.edges = {}
+
+	def observe(self, platform, base, quote, rate, maxAge=None):
+		if platform not in MARKET_PLATFORMS: return
+		if not base or not quote or base == quote or not rate or rate <= 0: return
+		# Every edge carries its own freshness bound, since sources update at different rates
+		expiry = time() + (self.maxAge if maxAge is None else maxAge)
+		edges = self.edges.setdefault(platform, {})
+		edges.setdefault(base, {})[quote] = (rate, expiry)
+		edges.setdefault(quote, {})[base] = (1 / rate, expiry)
+
+	def observe_quote(self, ticker, payload, maxAge=None):
+		raw = payload.get("raw", {})
+		price = (raw.get("quotePrice") or [None])[0]
+		if ticker is None or price is None: return
+		self.observe(payload.get("platform"), ticker.get("base"), ticker.get("quote"), price, maxAge)
+
+	def resolve(self, base, quote, platforms):
+		# Platforms are tried in the requested order, like upstream conversions
+		for platform in platforms:
+			resolved = self.resolve_on(self.edges.get(platform, {}), base, quote)
+			if resolved is not None: return resolved
+		return None
+
+	def resolve_on(self, edges, base, quote):
+		if base == quote or base not in edges or quote not in edges: return None
+		now = time()
+
+		# Paths are searched breadth first, so the fewest hops always win, and among paths of the same length the one
+		# whose stalest edge is the freshest is picked
+		best = {base: (float("inf"), 1.0, [base])}
+		frontier = [base]
+		for _ in range(self.maxHops):
+			candidates = {}
+			for node in frontier:
+				freshness, rate, path = best[node]
+				for neighbour, (edgeRate, expiry) in edges[node].items():
+					if neighbour in best or expiry < now: continue
+					candidate = (min(freshness, expiry), rate * edgeRate, path + [neighbour])
+					if neighbour not in candidates or candidate[0] > candidates[neighbour][0]:
+						candidates[neighbour] = candidate
+			if quote in candidates:
+				_, rate, path = candidates[quote]
+				return rate, path
+			if len(candidates) == 0: return None
+			best.update(candidates)
+			frontier = list(candidates)
+		return None
+
+	def prune(self):
+		now = time()
+		for platform in list(self.edges):
+			edges = self.edges[platform]
+			for node in list(edges):
+				neighbours = {key: edge for key, edge in edges[node].items() if edge[1] >= now}
+				if len(neighbours) == 0: edges.pop(node)
+				else: edges[node] = neighbours
+			if len(edges) == 0: self.edges.pop(platform)
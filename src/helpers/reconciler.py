@@ -0,0 +1,84 @@
+from time import time
+from array import array
+from asyncio import Semaphore, gather
+from traceback import format_exc
+
+from google.cloud.firestore import Increment
+
+
+def sorted_ids(ids):
+	return array("Q", sorted(int(e) for e in ids))
+
+def merge_diff(left, right):
+	onlyLeft, onlyRight = array("Q"), array("Q")
+	i, j = 0, 0
+	while i < len(left) and j < len(right):
+		if left[i] == right[j]:
+			i += 1
+			j += 1
+		elif left[i] < right[j]:
+			onlyLeft.append(left[i])
+			i += 1
+		else:
+			onlyRight.append(right[j])
+			j += 1
+	onlyLeft.extend(left[i:])
+	onlyRight.extend(right[j:])
+	return onlyLeft, onlyRight
+
+
+class GuildReconciler(object):
+	def __init__(self, database, fetch, create, path="discord/properties/guilds", concurrency=16, batchSize=500):
+		self.database = database
+		self.fetch = fetch
+		self.create = create
+		self.path = path
+		self.concurrency = Semaphore(concurrency)
+		self.batchSize = batchSize
+		# Watermark of missing guilds that were already checked in an earlier run
+		self.checked = array("Q")
+
+	async def run(self, guildIds, databaseIds, excluded=()):
+		guilds = sorted_ids(guildIds)
+		keys = sorted_ids(databaseIds)
+		missing, stale = merge_diff(guilds, keys)
+
+		# Guilds that are still missing after being checked are waiting for their settings to show up in the
+		# database keys, so only the ones that went missing since the last run are fetched
+		unchecked, _ = merge_diff(missing, self.checked)
+		checked = missing
+
+		writes = []
+		for guildId in stale:
+			if guildId in excluded: continue
+			writes.append((guildId, {"stale": {"count": Increment(1), "timestamp": time()}}, True))
+
+		failed = array("Q")
+		results = await gather(*[self.check(guildId) for guildId in unchecked])
+		for guildId, properties in zip(unchecked, results):
+			if properties is None:
+				failed.append(guildId)
+			elif not properties:
+				writes.append((guildId, self.create({}), False))
+		if len(failed) != 0:
+			# Guilds that couldn't be checked are retried in the next run
+			checked, _ = merge_diff(missing, failed)
+
+		# The watermark only moves once settings of newly missing guilds were written, so a failed commit is retried
+		await self.commit(writes)
+		self.checked = checked
+		return len(stale), len(unchecked)
+
+	async def check(self, guildId):
+		async with self.concurrency:
+			try: return await self.fetch(str(guildId)) or {}
+			except:
+				print(format_exc())
+				return None
+
+	async def commit(self, writes):
+		for i in range(0, len(writes), self.batchSize):
+			batch = self.database.batch()
+			for guildId, properties, merge in writes[i:i + self.batchSize]:
+				batch.set(self.database.document(f"{self.path}/{guildId}"), properties, merge=merge)
+			await batch.commit()
@@ -0,0 +1,63 @@
+from asyncio import shield
+from traceback import format_exc
+
+from discord.errors import NotFound, Forbidden
+
+from helpers.cache import TTLCache, MISSING
+
+
+class DiscordResolver(object):
+	def __init__(self, bot, maxsize=20000, ttl=3600.0, negativeTtl=600.0):
+		self.bot = bot
+		self.channels = TTLCache(maxsize=maxsize, ttl=ttl, negativeTtl=negativeTtl)
+		# DM channels keyed by user id, None for users whose DMs are closed or who no longer exist
+		self.dms = TTLCache(maxsize=maxsize, ttl=ttl, negativeTtl=negativeTtl)
+		self.inflight = {}
+
+	async def channel(self, channelId):
+		if channelId is None: return None
+		channelId = int(channelId)
+		channel = self.bot.get_channel(channelId)
+		if channel is not None: return channel
+		return await self.resolve(self.channels, channelId, self.bot.fetch_channel)
+
+	async def dm(self, userId):
+		if userId is None: return None
+		return await self.resolve(self.dms, int(userId), self.open_dm)
+
+	async def open_dm(self, userId):
+		user = self.bot.get_user(userId)
+		if user is None:
+			user = await self.bot.fetch_user(userId)
+		return await user.create_dm()
+
+	async def resolve(self, cache, key, fetch):
+		value = cache.get(key)
+		if value is not MISSING: return value
+
+		# Concurrent lookups of the same id share a single REST call
+		request = self.inflight.get((cache, key))
+		if request is None:
+			request = self.bot.loop.create_task(self.fetch(cache, key, fetch))
+			self.inflight[(cache, key)] = request
+			request.add_done_callback(lambda _: self.inflight.pop((cache, key), None))
+		return await shield(request)
+
+	async def fetch(self, cache, key, fetch):
+		try:
+			value = await fetch(key)
+		except (NotFound, Forbidden):
+			value = None
+		except:
+			print(format_exc())
+			return None
+		cache.set(key, value)
+		return value
+
+	def mark_unreachable(self, channel):
+		if channel is None: return
+		recipient = getattr(channel, "recipient", None)
+		if recipient is not None:
+			self.dms.set(recipient.id, None)
+		else:
+			self.channels.set(channel.id, None)
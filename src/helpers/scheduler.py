@@ -0,0 +1,105 @@
+from time import time
+from heapq import heappush, heappop
+from asyncio import Event, wait_for, create_task, gather, CancelledError
+from traceback import format_exc
+
+from discord.http import Route
+
+
+# Interaction tokens can only be used for 15 minutes after the interaction was created
+TOKEN_LIFETIME = 900
+
+
+async def edit_original_response(http, applicationId, token, payload):
+	route = Route("PATCH", "/webhooks/{webhook_id}/{webhook_token}/messages/@original", webhook_id=applicationId, webhook_token=token)
+	await http.request(route, json=payload)
+
+
+class CleanupScheduler(object):
+	def __init__(self):
+		self.entries = []
+		self.sequence = 0
+		self.http = None
+		self.database = None
+		self.path = None
+		self.link = None
+		self.wakeup = None
+		self.task = None
+
+	def schedule(self, delay, applicationId, token, content=None, expires=None):
+		due = time() + delay
+		if expires is None: expires = time() + TOKEN_LIFETIME
+		self.sequence += 1
+		heappush(self.entries, (due, self.sequence, str(applicationId), token, content, expires))
+		if self.wakeup is not None and self.entries[0][1] == self.sequence:
+			self.wakeup.set()
+
+	def start(self, http, database, snapshots, botId, bridge):
+		if self.task is not None: return
+		self.http = http
+		self.database = database
+		self.path = f"discord/properties/cleanup/{botId}"
+		self.wakeup = Event()
+		self.task = create_task(self.run())
+		# Entries persisted by a pod that is shutting down can appear at any point during a rolling restart
+		self.link = bridge.listen(snapshots.document(self.path), self.process_snapshot)
+
+	async def run(self):
+		try:
+			while True:
+				timeout = None if len(self.entries) == 0 else max(0, self.entries[0][0] - time())
+				try: await wait_for(self.wakeup.wait(), timeout=timeout)
+				except TimeoutError: pass
+				self.wakeup.clear()
+
+				now = time()
+				due = []
+				while len(self.entries) != 0 and self.entries[0][0] <= now:
+					due.append(heappop(self.entries))
+				if len(due) != 0:
+					await gather(*[self.execute(*entry) for entry in due])
+		except CancelledError: pass
+
+	async def execute(self, due, sequence, applicationId, token, content, expires):
+		if expires < time(): return
+		if content is None:
+			payload = {"components": []}
+		else:
+			payload = {"content": content, "embeds": [], "attachments": [], "components": []}
+		try: await edit_original_response(self.http, applicationId, token, payload)
+		except: pass
+
+	def process_snapshot(self, documents, changes, timestamp):
+		if len(documents) == 0 or not documents[0].exists: return
+		self.restore(documents[0].to_dict().get("entries", []))
+
+	def restore(self, entries):
+		now = time()
+		for entry in entries:
+			if entry["expires"] < now: continue
+			self.schedule(entry["due"] - now, entry["applicationId"], entry["token"], content=entry.get("content"), expires=entry["expires"])
+		create_task(self.database.document(self.path).delete())
+
+	async def close(self):
+		if self.link is not None:
+			self.link.unsubscribe()
+			self.link = None
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+
+		now = time()
+		entries = [{
+			"due": due,
+			"applicationId": applicationId,
+			"token": token,
+			"content": content,
+			"expires": expires
+		} for due, _, applicationId, token, content, expires in self.entries if expires > now]
+		if len(entries) == 0 or self.database is None: return
+
+		try: await self.database.document(self.path).set({"entries": entries})
+		except: print(format_exc())
+
+
+scheduler = CleanupScheduler()
@@ -0,0 +1,63 @@
+from asyncio import sleep, create_task, CancelledError
+from traceback import format_exc
+
+from google.cloud.firestore import Increment
+
+
+class StatisticsAggregator(object):
+	def __init__(self, interval=5.0):
+		self.interval = interval
+		self.counters = {}
+		self.database = None
+		self.shard = None
+		self.task = None
+
+	def increment(self, snapshot, key, count=1):
+		counters = self.counters.setdefault(snapshot, {})
+		counters[key] = counters.get(key, 0) + count
+
+	def start(self, database, shard):
+		self.database = database
+		self.shard = shard
+		if self.task is None:
+			self.task = create_task(self.run())
+
+	async def run(self):
+		try:
+			while True:
+				await sleep(self.interval)
+				await self.flush()
+		except CancelledError: pass
+
+	async def flush(self):
+		if self.database is None or len(self.counters) == 0: return
+		counters, self.counters = self.counters, {}
+
+		try:
+			# Every bot process writes into its own shard, so no single document receives writes from all of them
+			await self.database.document(f"discord/statistics/shards/{self.shard}").set({
+				snapshot: {key: Increment(count) for key, count in values.items()} for snapshot, values in counters.items()
+			}, merge=True)
+		except:
+			print(format_exc())
+			for snapshot, values in counters.items():
+				for key, count in values.items():
+					self.increment(snapshot, key, count)
+
+	async def close(self):
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+		await self.flush()
+
+
+async def read_statistics(database, snapshot):
+	totals = {}
+	shards = await database.collection("discord/statistics/shards").get()
+	for shard in shards:
+		for key, count in shard.to_dict().get(snapshot, {}).items():
+			totals[key] = totals.get(key, 0) + count
+	return totals
+
+
+statistics = StatisticsAggregator()
@@ -0,0 +1,134 @@
+from os import path, remove
+from collections import deque
+from asyncio import Event, Semaphore, get_running_loop, wait_for, wrap_future, gather, create_task, CancelledError
+from traceback import format_exc
+from orjson import dumps
+
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1 import types
+
+
+class TelemetryPublisher(object):
+	def __init__(self, client, maxQueue=20000, batchSize=200, batchLatency=2.0, maxInFlight=2, spoolPath="/tmp/telemetry.spool", spoolLimit=2 * 1024 * 1024):
+		self.client = client
+		self.maxQueue = maxQueue
+		self.batchSize = batchSize
+		self.batchLatency = batchLatency
+		self.spoolPath = spoolPath
+		# The pod only has a few megabytes of ephemeral storage, so the spool is capped well below that
+		self.spoolLimit = spoolLimit
+
+		self.queue = deque()
+		self.ready = None
+		self.inFlight = Semaphore(maxInFlight)
+		self.task = None
+
+		self.published = 0
+		self.dropped = 0
+		self.failed = 0
+		self.spooled = 0
+
+	def submit(self, topic, record):
+		if len(self.queue) >= self.maxQueue:
+			self.dropped += 1
+			return
+		self.queue.append((topic, dumps(record)))
+		# The worker is only woken up early once a full batch is waiting
+		if len(self.queue) >= self.batchSize and self.ready is not None:
+			self.ready.set()
+
+	def start(self):
+		if self.task is None:
+			self.ready = Event()
+			self.task = create_task(self.run())
+
+	async def run(self):
+		try:
+			while True:
+				try: await wait_for(self.ready.wait(), timeout=self.batchLatency)
+				except TimeoutError: pass
+				self.ready.clear()
+				await self.flush()
+		except CancelledError: pass
+
+	async def flush(self):
+		batches = []
+		while len(self.queue) != 0:
+			batch = [self.queue.popleft() for _ in range(min(self.batchSize, len(self.queue)))]
+			batches.append(create_task(self.publish(batch)))
+		if len(batches) != 0:
+			await gather(*batches)
+
+	async def publish(self, batch):
+		async with self.inFlight:
+			try:
+				# Publishing blocks when the client's flow control limits are reached, so it never runs on the event loop
+				futures = await get_running_loop().run_in_executor(None, self.publish_sync, batch)
+				results = await gather(*[wrap_future(future) for future in futures], return_exceptions=True)
+			except:
+				print(format_exc())
+				failed = batch
+			else:
+				failed = [message for message, result in zip(batch, results) if isinstance(result, Exception)]
+
+			self.published += len(batch) - len(failed)
+			self.failed += len(failed)
+
+			if len(failed) != 0:
+				self.spool(failed)
+			elif path.exists(self.spoolPath):
+				self.replay()
+
+	def publish_sync(self, batch):
+		return [self.client.publish(topic, data) for topic, data in batch]
+
+	def spool(self, messages):
+		try:
+			size = path.getsize(self.spoolPath) if path.exists(self.spoolPath) else 0
+			with open(self.spoolPath, "ab") as spool:
+				for topic, data in messages:
+					line = topic.encode() + b" " + data + b"\n"
+					if size + len(line) > self.spoolLimit:
+						self.dropped += 1
+						continue
+					spool.write(line)
+					size += len(line)
+					self.spooled += 1
+		except:
+			print(format_exc())
+			self.dropped += len(messages)
+
+	def replay(self):
+		try:
+			with open(self.spoolPath, "rb") as spool:
+				lines = spool.read().splitlines()
+			remove(self.spoolPath)
+		except:
+			print(format_exc())
+			return
+
+		for line in lines:
+			topic, _, data = line.partition(b" ")
+			if len(self.queue) >= self.maxQueue:
+				self.dropped += 1
+				continue
+			self.queue.append((topic.decode(), data))
+
+	async def close(self):
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+		await self.flush()
+
+
+client = pubsub_v1.PublisherClient(
+	batch_settings=types.BatchSettings(max_messages=500, max_latency=1.0),
+	publisher_options=types.PublisherOptions(
+		flow_control=types.PublishFlowControl(
+			message_limit=5000,
+			byte_limit=5 * 1024 * 1024,
+			limit_exceeded_behavior=types.LimitExceededBehavior.BLOCK
+		)
+	)
+)
+publisher = TelemetryPublisher(client)
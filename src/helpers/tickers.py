@@ -0,0 +1,69 @@
+from os import environ
+from time import time
+from asyncio import gather, shield, create_task
+
+from helpers.cache import TTLCache, MISSING
+from helpers.alerts import ticker_hash
+
+
+class TickerRegistry(object):
+	def __init__(self, path="discord/properties/tickers", maxsize=20000, ttl=86400.0, compactOnly=None):
+		self.path = path
+		# The alert and order services outside the bot still read the embedded ticker, so it's only left out once they
+		# resolve references themselves
+		self.compactOnly = bool(environ.get("COMPACT_TICKERS")) if compactOnly is None else compactOnly
+		# Registry entries are keyed by their content hash and never change, so they can be cached for a long time
+		self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+		self.inflight = {}
+		self.database = None
+
+	def start(self, database):
+		self.database = database
+
+	async def register(self, ticker):
+		tickerId = ticker_hash(ticker)
+		if tickerId not in self.cache:
+			await self.database.document(f"{self.path}/{tickerId}").set({"ticker": ticker, "timestamp": time()})
+			self.cache.set(tickerId, ticker)
+		return tickerId
+
+	async def resolve(self, tickerId):
+		ticker = self.cache.get(tickerId)
+		if ticker is not MISSING: return ticker
+
+		request = self.inflight.get(tickerId)
+		if request is None:
+			request = create_task(self.fetch(tickerId))
+			self.inflight[tickerId] = request
+			request.add_done_callback(lambda _: self.inflight.pop(tickerId, None))
+		return await shield(request)
+
+	async def fetch(self, tickerId):
+		entry = await self.database.document(f"{self.path}/{tickerId}").get()
+		ticker = entry.to_dict().get("ticker") if entry.exists else None
+		if ticker is not None: self.cache.set(tickerId, ticker)
+		return ticker
+
+	async def compact(self, task):
+		# Single platform tasks store a reference to the registry, with or without the full ticker
+		compacted = {key: value for key, value in task.items() if key != "ticker" or not self.compactOnly}
+		compacted["tickerRef"] = await self.register(task["ticker"])
+		return compacted
+
+	async def compact_request(self, request):
+		compacted = dict(request)
+		platforms = request.get("platforms", [])
+		for platform, task in zip(platforms, await gather(*[self.compact(request[platform]) for platform in platforms])):
+			compacted[platform] = task
+		return compacted
+
+	async def expand(self, task):
+		# Documents written before the registry existed, or while the full ticker is still stored, carry the ticker
+		if task is None or "tickerRef" not in task: return task
+		expanded = {key: value for key, value in task.items() if key != "tickerRef"}
+		if "ticker" not in expanded:
+			expanded["ticker"] = await self.resolve(task["tickerRef"]) or {}
+		return expanded
+
+
+tickerRegistry = TickerRegistry()
@@ -0,0 +1,267 @@
+from time import time, perf_counter
+from random import Random
+from bisect import bisect_left, bisect_right
+from asyncio import Semaphore, sleep, gather, create_task, CancelledError
+from traceback import format_exc
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from helpers import constants
+from helpers.alerts import alertIndex, ticker_reference
+from helpers.tickers import tickerRegistry
+from helpers.quotas import quotas
+from Processor import process_task
+
+
+class LevelBook(object):
+	__slots__ = ("above", "aboveKeys", "below", "belowKeys")
+
+	def __init__(self):
+		# Both sides are kept sorted so that triggered alerts always form a suffix: alerts above the price are stored
+		# with negated levels, alerts below the price as they are
+		self.above, self.aboveKeys = [], []
+		self.below, self.belowKeys = [], []
+
+	def side(self, placement):
+		return (self.above, self.aboveKeys) if placement == "above" else (self.below, self.belowKeys)
+
+	@staticmethod
+	def position(placement, level):
+		return -level if placement == "above" else level
+
+	def insert(self, placement, level, key):
+		levels, keys = self.side(placement)
+		position = self.position(placement, level)
+		i = bisect_right(levels, position)
+		levels.insert(i, position)
+		keys.insert(i, key)
+
+	def delete(self, placement, level, key):
+		levels, keys = self.side(placement)
+		position = self.position(placement, level)
+		i = bisect_left(levels, position)
+		while i < len(levels) and levels[i] == position:
+			if keys[i] == key:
+				del levels[i]
+				del keys[i]
+				return True
+			i += 1
+		return False
+
+	def trigger(self, price):
+		triggered = []
+		i = bisect_left(self.above, -price)
+		if i < len(self.above):
+			triggered.extend(self.aboveKeys[i:])
+			del self.above[i:], self.aboveKeys[i:]
+		i = bisect_left(self.below, price)
+		if i < len(self.below):
+			triggered.extend(self.belowKeys[i:])
+			del self.below[i:], self.belowKeys[i:]
+		return triggered
+
+	def __len__(self):
+		return len(self.above) + len(self.below)
+
+
+class QuoteFeed(object):
+	def __init__(self, interval=10.0, concurrency=8):
+		self.interval = interval
+		self.concurrency = Semaphore(concurrency)
+		# Ticker hash -> (platform, task), the task of the first alert set for that ticker
+		self.tickers = {}
+
+	def subscribe(self, tickerId, alert):
+		if tickerId in self.tickers: return
+		self.tickers[tickerId] = (alert["currentPlatform"], alert["request"])
+
+	def unsubscribe(self, tickerId):
+		self.tickers.pop(tickerId, None)
+
+	async def quote(self, tickerId, platform, task):
+		async with self.concurrency:
+			try:
+				task = await tickerRegistry.expand(task)
+				payload, _ = await process_task({"platforms": [platform], "currentPlatform": platform, platform: task}, "quote")
+			except:
+				print(format_exc())
+				return tickerId, None
+		if payload is None or len(payload.get("raw", {}).get("quotePrice", [])) == 0: return tickerId, None
+		return tickerId, payload["raw"]["quotePrice"][0]
+
+	async def stream(self):
+		# Every watched ticker is quoted once per interval, no matter how many alerts are set on it
+		while True:
+			start = time()
+			for tickerId, price in await gather(*[self.quote(tickerId, *entry) for tickerId, entry in list(self.tickers.items())]):
+				if price is not None: yield tickerId, price
+			await sleep(max(self.interval - (time() - start), 0))
+
+
+class SimulatedFeed(object):
+	def __init__(self, seed=0, interval=1.0, volatility=0.002):
+		self.seed = seed
+		self.interval = interval
+		self.volatility = volatility
+		self.tickers = {}
+
+	def subscribe(self, tickerId, alert):
+		if tickerId in self.tickers: return
+		# Every ticker walks from the level of its first alert with its own generator, so a given seed always replays
+		# the same ticks. Only meant for benchmarks, prices are made up.
+		self.tickers[tickerId] = [alert["level"], Random(f"{self.seed}:{tickerId}")]
+
+	def unsubscribe(self, tickerId):
+		self.tickers.pop(tickerId, None)
+
+	async def stream(self):
+		while True:
+			for tickerId, state in list(self.tickers.items()):
+				state[0] *= 1 + state[1].gauss(0, self.volatility)
+				yield tickerId, state[0]
+			await sleep(self.interval)
+
+
+class TriggerEngine(object):
+	def __init__(self, feed=None, concurrency=16):
+		self.feed = feed
+		self.concurrency = concurrency
+		self.books = {}
+		# (owner id, alert id) -> (ticker hash, placement, level, alert)
+		self.alerts = {}
+		self.deliver = None
+		self.database = None
+		self.task = None
+
+	def start(self, deliver, database, botId, feed=None):
+		if feed is not None: self.feed = feed
+		if self.feed is None:
+			# Alerts are deleted and delivered as soon as they trigger, so the engine never runs without real prices
+			print("[Startup]: Local alert triggers require a price feed, the trigger engine was not started")
+			return
+		self.deliver = deliver
+		self.database = database
+		if self.task is None:
+			self.task = create_task(self.run(botId))
+
+	def add(self, ownerId, alertId, alert):
+		if self.task is None: return
+		self.insert(ticker_reference(alert["request"]), str(ownerId), alertId, alert)
+
+	def insert(self, tickerId, ownerId, alertId, alert):
+		key = (ownerId, alertId)
+		self.remove(ownerId, alertId)
+		book = self.books.get(tickerId)
+		if book is None:
+			book = self.books[tickerId] = LevelBook()
+			self.feed.subscribe(tickerId, alert)
+		book.insert(alert["placement"], alert["level"], key)
+		self.alerts[key] = (tickerId, alert["placement"], alert["level"], alert)
+
+	def remove(self, ownerId, alertId):
+		entry = self.alerts.pop((str(ownerId), alertId), None)
+		if entry is None: return
+		tickerId, placement, level, _ = entry
+		book = self.books[tickerId]
+		book.delete(placement, level, (str(ownerId), alertId))
+		if len(book) == 0: self.drop(tickerId)
+
+	def drop(self, tickerId):
+		self.books.pop(tickerId)
+		self.feed.unsubscribe(tickerId)
+
+	def tick(self, tickerId, price):
+		book = self.books.get(tickerId)
+		if book is None: return []
+		triggered = [(key, self.alerts.pop(key)[3]) for key in book.trigger(price)]
+		if len(book) == 0: self.drop(tickerId)
+		return triggered
+
+	async def load(self, botId):
+		# Only owners with alerts set through the bot have a positive counter, so empty collections are never read
+		owners = await self.database.collection(quotas.path).where(filter=FieldFilter("marketAlerts.count", ">", 0)).select(["marketAlerts.count"]).get()
+		limit = Semaphore(self.concurrency)
+
+		async def load_owner(ownerId):
+			async with limit:
+				try:
+					for alert in await self.database.collection(f"details/marketAlerts/{ownerId}").where(filter=FieldFilter("botId", "==", botId)).get():
+						self.add(ownerId, alert.id, alert.to_dict())
+				except:
+					print(format_exc())
+
+		await gather(*[load_owner(owner.id) for owner in owners])
+
+	async def run(self, botId):
+		try:
+			await self.load(botId)
+			async for tickerId, price in self.feed.stream():
+				for (ownerId, alertId), alert in self.tick(tickerId, price):
+					try: await self.fire(ownerId, alertId, alert, price)
+					except: print(format_exc())
+		except CancelledError: pass
+
+	async def fire(self, ownerId, alertId, alert, price):
+		ticker = (await tickerRegistry.expand(alert["request"])).get("ticker")
+		exchangeName = f" ({ticker.get('exchange').get('name')})" if ticker.get("exchange") else ""
+		pairQuoteName = " " + ticker.get("quote") if ticker.get("quote") else ""
+
+		message = {
+			"title": f"Price of {ticker.get('name')}{exchangeName} hit {alert.get('levelText', alert['level'])}{pairQuoteName}.",
+			"description": alert.get("triggerMessage"),
+			"tag": alert.get("triggerTag"),
+			"subtitle": "Price Alerts",
+			"icon": ticker.get("image"),
+			"color": constants.colors["deep purple"]
+		}
+		# Discord user ids are numeric, while alerts owned by accounts can only fall back to the channel they were set in
+		userId = alert.get("authorId", ownerId if ownerId.isdigit() else None)
+		if alert.get("channel") is not None:
+			message["channel"] = alert["channel"]
+			message["backupUser"] = userId
+		elif userId is not None:
+			message["user"] = userId
+			message["backupChannel"] = alert.get("backupChannel")
+		else:
+			message["channel"] = alert.get("backupChannel")
+
+		# Alerts are removed before they're handed off, so that a restart can never send the same alert twice
+		await quotas.remove("marketAlerts", ownerId, alertId)
+		alertIndex.remove(ownerId, alertId)
+		self.deliver(f"alert-{alertId}", message)
+
+	async def close(self):
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+
+
+triggers = TriggerEngine()
+
+
+def benchmark(alertCount=1000000, tickerCount=1000, tickCount=200000, seed=0):
+	random = Random(seed)
+	engine = TriggerEngine(feed=SimulatedFeed())
+	prices = [random.uniform(1, 1000) for _ in range(tickerCount)]
+
+	start = perf_counter()
+	for i in range(alertCount):
+		tickerId = i % tickerCount
+		level = prices[tickerId] * random.uniform(0.8, 1.2)
+		engine.insert(tickerId, str(i % 50000), str(i), {"level": level, "placement": "above" if level > prices[tickerId] else "below"})
+	loaded = perf_counter() - start
+
+	triggered = 0
+	start = perf_counter()
+	for _ in range(tickCount):
+		tickerId = random.randrange(tickerCount)
+		prices[tickerId] *= 1 + random.gauss(0, 0.01)
+		triggered += len(engine.tick(tickerId, prices[tickerId]))
+	evaluated = perf_counter() - start
+
+	print(f"Loaded {alertCount} alerts across {tickerCount} tickers in {loaded:.2f} s")
+	print(f"Evaluated {tickCount} ticks in {evaluated:.2f} s ({evaluated / tickCount * 1e6:.2f} µs per tick), {triggered} alerts triggered")
+
+
+if __name__ == "__main__":
+	benchmark()
@@ -0,0 +1,102 @@
+from asyncio import gather
+from traceback import format_exc
+
+from helpers.cache import TTLCache, MISSING
+from helpers.tickers import tickerRegistry
+from helpers.conversions import conversions
+
+
+ACCEPTABLE = ["USD", "USDT", "USDC", "BUSD"]
+
+
+class Valuation(object):
+	__slots__ = ("holdings", "openOrdersValue", "assets")
+
+	def __init__(self, holdings, openOrdersValue, assets):
+		# List of (platform, asset, holding, value), where the value is None if the asset couldn't be priced
+		self.holdings = holdings
+		self.openOrdersValue = openOrdersValue
+		self.assets = assets
+
+
+class PortfolioValuation(object):
+	def __init__(self, maxsize=5000, ttl=60.0):
+		# Valuations are dropped on every trade. The time limit bounds how stale prices can get in between, and how long
+		# orders filled by the order service are still counted as open.
+		self.valuations = TTLCache(maxsize=maxsize, ttl=ttl)
+		self.database = None
+
+	def start(self, database):
+		self.database = database
+
+	def invalidate(self, *ownerIds):
+		for ownerId in ownerIds:
+			if ownerId is None: continue
+			self.valuations.pop(str(ownerId))
+
+	async def open_orders(self, ownerId):
+		# Read with every valuation, so that an order is never counted both as open and in the balance it filled into
+		orders = []
+		for element in await self.database.collection(f"details/openPaperOrders/{ownerId}").get():
+			order = element.to_dict()
+			if order["orderType"] not in ["buy", "sell"]: continue
+			currentPlatform = order["request"].get("currentPlatform")
+			task = await tickerRegistry.expand(order["request"].get(currentPlatform))
+			orders.append((currentPlatform, order["orderType"], order["amount"], order["price"], task.get("ticker")))
+		return orders
+
+	async def get(self, request, paper):
+		ownerId = str(request.accountId if request.is_registered() else request.authorId)
+		valuation = self.valuations.get(ownerId)
+		if valuation is not MISSING: return valuation
+
+		ownerIds = [str(e) for e in [request.accountId, request.authorId] if e is not None]
+		openOrders = [order for orders in await gather(*[self.open_orders(e) for e in ownerIds]) for order in orders]
+
+		# Every asset is priced once per unit, no matter how many holdings and open orders refer to it
+		positions, assets = [], []
+		for platform, balances in paper.get("balance", {}).items():
+			if platform == "USD": continue
+			for asset, holding in balances.items():
+				if holding == 0: continue
+				positions.append((platform, asset, holding))
+				assets.append((platform, asset))
+
+		orderPositions = []
+		for platform, orderType, amount, price, ticker in openOrders:
+			if orderType == "buy":
+				orderPositions.append((platform, ticker.get("quote"), amount * price))
+			else:
+				orderPositions.append((platform, ticker.get("base"), amount))
+
+		pairs = list({(platform, asset, "USD") for platform, asset, _ in positions + orderPositions})
+		rates = dict(zip(pairs, await gather(*[self.rate(request, *pair) for pair in pairs])))
+
+		holdings = []
+		for platform, asset, holding in positions:
+			rate = rates[(platform, asset, "USD")]
+			holdings.append((platform, asset, holding, None if rate is None else holding * rate))
+
+		openOrdersValue = 0
+		for (platform, asset, amount), (_, _, _, _, ticker) in zip(orderPositions, openOrders):
+			rate = rates[(platform, asset, "USD")]
+			if rate is not None: openOrdersValue += amount * rate
+			assets.append((platform, ticker.get("base")))
+
+		valuation = Valuation(holdings, openOrdersValue, assets)
+		self.valuations.set(ownerId, valuation)
+		return valuation
+
+	async def rate(self, request, platform, asset, quote):
+		try:
+			payload, responseMessage = await conversions.convert(request, asset, quote, 1, [platform], acceptable=ACCEPTABLE)
+		except:
+			print(format_exc())
+			return None
+		if payload is None:
+			print(f"Conversion failed: {responseMessage}")
+			return None
+		return payload["raw"]["quotePrice"][0]
+
+
+valuations = PortfolioValuation()
@@ -0,0 +1,36 @@
+from ast import parse, walk, Import, ImportFrom, Attribute, Name
+from pathlib import Path
+
+
+SOURCE = Path(__file__).resolve().parent.parent / "src"
+
+# Modules whose HTTP calls block the event loop, all outbound HTTP goes through helpers.http instead
+BLOCKING_MODULES = {"requests", "pycoingecko", "urllib.request", "urllib3", "httplib2", "http.client"}
+BLOCKING_CALLS = {"urlopen", "get_coins_markets"}
+
+# google-auth refreshes credentials over requests, which only happens at startup and on executor threads
+ALLOWED_IMPORTS = {"google.auth.transport.requests"}
+
+
+def blocking(module):
+	return module not in ALLOWED_IMPORTS and any(module == e or module.startswith(e + ".") for e in BLOCKING_MODULES)
+
+def violations(path):
+	tree = parse(path.read_text(), filename=str(path))
+	for node in walk(tree):
+		if isinstance(node, Import):
+			for alias in node.names:
+				if blocking(alias.name): yield node.lineno, f"import {alias.name}"
+		elif isinstance(node, ImportFrom) and node.level == 0 and node.module is not None:
+			if blocking(node.module): yield node.lineno, f"from {node.module} import ..."
+			for alias in node.names:
+				if alias.name == "urlopen": yield node.lineno, f"from {node.module} import urlopen"
+		elif isinstance(node, Attribute) and node.attr in BLOCKING_CALLS:
+			# The shared client's coroutine is imported by name, attribute access means a synchronous client object
+			if not (isinstance(node.value, Name) and node.value.id == "http"):
+				yield node.lineno, f".{node.attr}"
+
+
+def test_no_blocking_http():
+	found = [f"{path.relative_to(SOURCE)}:{line}: {usage}" for path in sorted(SOURCE.rglob("*.py")) for line, usage in violations(path)]
+	assert found == [], "Blocking HTTP calls under src/, use helpers.http instead:\n" + "\n".join(found)
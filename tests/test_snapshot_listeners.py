@@ -0,0 +1,16 @@
+from ast import parse, walk, Attribute
+from pathlib import Path
+
+
+SOURCE = Path(__file__).resolve().parent.parent / "src"
+
+
+def test_listeners_go_through_bridge():
+	# Snapshot callbacks run on the watch thread unless SnapshotBridge hands them to the event loop
+	found = []
+	for path in sorted(SOURCE.rglob("*.py")):
+		if path == SOURCE / "helpers" / "bridge.py": continue
+		for node in walk(parse(path.read_text(), filename=str(path))):
+			if isinstance(node, Attribute) and node.attr == "on_snapshot":
+				found.append(f"{path.relative_to(SOURCE)}:{node.lineno}")
+	assert found == [], "Snapshot listeners must be registered with SnapshotBridge.listen:\n" + "\n".join(found)